@@ -0,0 +1,112 @@
+import argparse
+import importlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+
+def run(pages: int, rounds: int, latency: float, error_rate: float, malformed_rate: float,
+        churn: float, target: str) -> dict:
+    """
+    Runs several collections of the given number of pages against a fresh database
+    and a local mock API.
+
+    Args:
+        pages (int): The number of pages to serve and collect.
+        rounds (int): The number of collections to run.
+        latency (float): Seconds the mock API waits before each response.
+        error_rate (float): The chance of a mock API request failing.
+        malformed_rate (float): The chance of each member row missing its id or xp.
+        churn (float): The chance of each member gaining xp between collections.
+        target (str): The collector function to run, as [module:]function.
+
+    Returns:
+        dict: The results of the benchmark.
+    """
+    from gwaff import collector
+    from gwaff.benchmark.mock_api import MockAPIServer, MockLeaderboard
+    from gwaff.database.db_base import DatabaseCreator, DatabaseReader, DB_DIR
+    from gwaff.database.structs import Record
+    from gwaff.spool import Spool
+
+    module, _, name = target.rpartition(':') if ':' in target else ('gwaff.collector', '', target)
+    record = getattr(importlib.import_module(module), name)
+
+    if os.path.exists(DB_DIR):
+        os.remove(DB_DIR)
+    DatabaseCreator().create_database()
+    collector.last_values = None
+    collector.last_ranks.clear()
+    collector.profile_fingerprints = None
+    collector.spool = Spool(DB_DIR + '.spool.jsonl')
+
+    api = MockAPIServer(MockLeaderboard(pages=pages, churn=churn),
+                        latency=latency, error_rate=error_rate, malformed_rate=malformed_rate)
+    api.start()
+    collector.API_URL = api.url
+
+    timings = []
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            try:
+                record(pages=range(1, pages + 1), min_time=0)
+            except collector.ManyFailuresException:
+                pass
+            timings.append(time.perf_counter() - start)
+    finally:
+        api.stop()
+
+    rows = DatabaseReader().session.query(Record).count()
+    sample = collector.metrics.samples[-1] if collector.metrics.samples else {}
+    members = pages * api.leaderboard.page_size
+    return {
+        'pages': pages,
+        'rounds': rounds,
+        'seconds': timings,
+        'pages_per_second': pages * rounds / sum(timings),
+        'members_per_second': members * rounds / sum(timings),
+        'rows': rows,
+        'rows_per_round': rows / rounds,
+        'db_bytes': os.path.getsize(DB_DIR),
+        'requests': api.requests,
+        'last_commit_time': sample.get('commit_time'),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the collector against a local mock API, e.g. "
+                                                 "python -m gwaff.benchmark.collector_bench --pages 10 100")
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0, help="Seconds per mock API response")
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--malformed-rate', type=float, default=0)
+    parser.add_argument('--churn', type=float, default=0.3,
+                        help="Chance of each member gaining xp between collections")
+    parser.add_argument('--target', default='record_data',
+                        help="Collector function to run, as [module:]function")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # The database location is read on import, so it must be set first
+    os.environ['DB_NAME'] = os.path.join(tempfile.mkdtemp(prefix='gwaff-bench-'), 'bench.db')
+
+    # Statement logging would dominate the timings
+    logging.getLogger('sqlalchemy.engine.Engine').setLevel(logging.WARNING)
+
+    results = []
+    for count in args.pages:
+        result = run(count, args.rounds, args.latency, args.error_rate, args.malformed_rate,
+                     args.churn, args.target)
+        results.append(result)
+        print(f"{count:>5} pages: {result['pages_per_second']:8.1f} pages/s "
+              f"{result['members_per_second']:9.0f} members/s "
+              f"{result['rows_per_round']:9.0f} rows/round "
+              f"{result['db_bytes'] / 1024:9.0f} KiB")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,164 @@
+import json
+import random
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock, Thread
+from urllib.parse import urlparse, parse_qs
+
+from gwaff.custom_logger import Logger
+
+logger = Logger('gwaff.benchmark.api')
+
+PAGE_SIZE: int = 100  # Members per page, matching the live API
+
+
+class MockLeaderboard:
+    """
+    A fake leaderboard whose members gain xp over time.
+
+    Attributes:
+        members (list): The members, as dictionaries in the API format, highest xp first.
+        churn (float): The chance of each member gaining xp between requests of their page.
+    """
+
+    def __init__(self, pages: int = 10, page_size: int = PAGE_SIZE,
+                 churn: float = 0.3, seed: int = 0):
+        """
+        Initialises the leaderboard.
+
+        Args:
+            pages (int, optional): The number of full pages of members. Defaults to 10.
+            page_size (int, optional): The number of members per page. Defaults to PAGE_SIZE.
+            churn (float, optional): The chance of a member gaining xp per request. Defaults to 0.3.
+            seed (int, optional): The random seed. Defaults to 0.
+        """
+        self.random = random.Random(seed)
+        self.page_size = page_size
+        self.churn = churn
+        self.members = []
+        self.lock = Lock()
+        for i in range(pages * page_size):
+            id = 100_000_000_000_000_000 + i
+            colour = '#%06x' % self.random.randint(0, 0xFFFFFF)
+            self.members.append({
+                'id': str(id),
+                'username': f'member{i}',
+                'displayname': f'Member {i}',
+                'color': colour,
+                'colors': [colour, '#%06x' % self.random.randint(0, 0xFFFFFF)],
+                'avatar': f'https://cdn.discordapp.com/embed/avatars/{i % 6}.png',
+                'xp': 10_000_000 // (i + 1) + 12_017,
+            })
+
+    def page(self, page: int) -> list[dict]:
+        """
+        Gets a page of members, giving some of them more xp first.
+
+        Args:
+            page (int): The page number, starting at 1.
+
+        Returns:
+            list: The members on the page.
+        """
+        with self.lock:
+            start = (page - 1) * self.page_size
+            members = self.members[start:start + self.page_size]
+            for member in members:
+                if self.random.random() < self.churn:
+                    member['xp'] += self.random.randint(15, 25)
+            return [dict(member) for member in members]
+
+
+class MockAPIServer:
+    """
+    A local stand-in for the leaderboard API, serving pages in the same JSON shape.
+
+    Attributes:
+        leaderboard (MockLeaderboard): The data being served.
+        latency (float): Seconds to wait before each response.
+        error_rate (float): The chance of a request failing with a server error.
+        malformed_rate (float): The chance of each member row missing its id or xp.
+        requests (int): The number of requests received.
+        url (str): The URL of the server, usable as API_URL.
+    """
+
+    def __init__(self, leaderboard: MockLeaderboard,
+                 latency: float = 0, error_rate: float = 0, malformed_rate: float = 0,
+                 host: str = '127.0.0.1', port: int = 0):
+        """
+        Initialises the server. Port 0 picks a free port.
+        """
+        self.leaderboard = leaderboard
+        self.latency = latency
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.random = random.Random(1)
+        self.requests = 0
+        # Requests are handled in threads, which share the count and the random state
+        self.lock = Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                    failed = server.random.random() < server.error_rate
+                if server.latency:
+                    time.sleep(server.latency)
+                if failed:
+                    self.respond(500, {'error': 'mock failure'})
+                    return
+
+                query = parse_qs(urlparse(self.path).query)
+                page = int(query.get('page', ['1'])[0])
+                members = server.leaderboard.page(page)
+                with server.lock:
+                    for member in members:
+                        if server.random.random() < server.malformed_rate:
+                            del member[server.random.choice(['id', 'xp'])]
+                self.respond(200, {'members': members, 'page': page})
+
+            def respond(self, status: int, body: dict):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://{host}:{self.httpd.server_address[1]}/'
+        self.thread: Thread | None = None
+
+    def start(self) -> None:
+        """
+        Starts serving in a background thread.
+        """
+        self.thread = Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Mock API serving at {self.url}")
+
+    def stop(self) -> None:
+        """
+        Stops the server.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+    api = MockAPIServer(MockLeaderboard(pages=10), latency=0.05)
+    api.start()
+    logger.info("Press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        api.stop()
@@ -0,0 +1,225 @@
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+STAGES = ['fetch', 'draw', 'events', 'annotate', 'configure', 'save']
+
+
+def build_database(users: int, years: float, sample_minutes: int, seed: int = 0) -> int:
+    """
+    Fills a fresh database with members gaining xp at random, stored the way the collector
+    stores them: only when the xp changes, plus a keyframe every RECORD_KEYFRAME_HOURS.
+
+    Args:
+        users (int): The number of members.
+        years (float): How far back the records go.
+        sample_minutes (int): The minutes between collections.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        int: The number of records stored.
+    """
+    from sqlalchemy import insert
+
+    from gwaff.database.db_base import DatabaseCreator, DatabaseSaver, DB_DIR, RECORD_KEYFRAME_HOURS
+    from gwaff.database.structs import Record
+
+    if os.path.exists(DB_DIR):
+        os.remove(DB_DIR)
+    DatabaseCreator().create_database()
+
+    rng = random.Random(seed)
+    dbs = DatabaseSaver()
+    now = datetime.now().replace(second=0, microsecond=0)
+    start = now - timedelta(days=365 * years)
+    step = timedelta(minutes=sample_minutes)
+    keyframe = timedelta(hours=RECORD_KEYFRAME_HOURS)
+
+    for user in range(users):
+        # Avatars are left out so the benchmark does not depend on the network
+        dbs.update_profile(user + 1, f'Member {user}', '#%06x' % rng.randint(0, 0xFFFFFF), None,
+                           timestamp=start)
+    dbs.commit()
+
+    total = 0
+    for user in range(users):
+        activity = rng.random()
+        xp = rng.randint(12_017, 5_000_000)
+        rows = [{'id': user + 1, 'timestamp': start, 'value': xp}]
+        stored = start
+        t = start + step
+        while t <= now:
+            if rng.random() < activity:
+                xp += rng.randint(15, 25)
+                rows.append({'id': user + 1, 'timestamp': t, 'value': xp})
+                stored = t
+            elif t - stored >= keyframe:
+                rows.append({'id': user + 1, 'timestamp': t, 'value': xp})
+                stored = t
+            t += step
+        dbs.session.execute(insert(Record), rows)
+        total += len(rows)
+    dbs.commit()
+    return total
+
+
+def growth_plotter(count: int) -> type:
+    """
+    Finds the plotter render_growth uses for a number of users.
+
+    Args:
+        count (int): Number of users to plot.
+
+    Returns:
+        type: FastGrowth or Growth.
+    """
+    from gwaff.plotter.fast import FastGrowth, FAST_MAX_SERIES
+    from gwaff.plotter.growth import Growth
+
+    return FastGrowth if count <= FAST_MAX_SERIES else Growth
+
+
+def time_growth(days: float, count: int, rounds: int) -> dict:
+    """
+    Times each stage of a growth plot, as drawn by render_growth.
+
+    Args:
+        days (float): Number of days to plot.
+        count (int): Number of users to plot.
+        rounds (int): The number of times to draw it.
+
+    Returns:
+        dict: The median seconds of each stage and in total.
+    """
+    plotter = growth_plotter(count)
+
+    class TimedGrowth(plotter):
+        # Serves the data fetched ahead of draw, so fetching is timed on its own
+        def get_data(self, limit: int, include: set[int] = None) -> list[tuple]:
+            return self.data
+
+    timings = {stage: [] for stage in STAGES}
+    timings['total'] = []
+    for _ in range(rounds):
+        marks = [time.perf_counter()]
+        plot = TimedGrowth(start_date=datetime.now() - timedelta(days=days),
+                           title="Top chatters XP growth")
+        plot.data = plotter.get_data(plot, count)
+        marks.append(time.perf_counter())
+        plot.draw(limit=count)
+        marks.append(time.perf_counter())
+        plot.draw_events()
+        marks.append(time.perf_counter())
+        plot.annotate()
+        marks.append(time.perf_counter())
+        plot.configure()
+        marks.append(time.perf_counter())
+        plot.render()
+        marks.append(time.perf_counter())
+        plot.close()
+
+        for stage, start, end in zip(STAGES, marks, marks[1:]):
+            timings[stage].append(end - start)
+        timings['total'].append(marks[-1] - marks[0])
+
+    return {stage: statistics.median(values) for stage, values in timings.items()}
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float, floor: float) -> list[str]:
+    """
+    Finds the stages that got slower than the baseline.
+
+    Args:
+        results (list): The results of this run.
+        baseline (list): The results of an earlier run.
+        tolerance (float): The allowed slowdown, as a fraction of the baseline time.
+        floor (float): Slowdowns smaller than this many seconds are ignored as noise.
+
+    Returns:
+        list: A description of each regression.
+    """
+    # Cases drawn by a different plotter are not comparable
+    previous = {(case['days'], case['count'], case.get('plotter', 'Growth')): case['stages']
+                for case in baseline}
+    regressions = []
+    for case in results:
+        old = previous.get((case['days'], case['count'], case['plotter']))
+        if old is None:
+            continue
+        for stage, seconds in case['stages'].items():
+            if stage not in old:
+                continue
+            if seconds > old[stage] * (1 + tolerance) and seconds - old[stage] > floor:
+                regressions.append(f"{case['days']} days x {case['count']} users ({case['plotter']}) {stage}: "
+                                   f"{old[stage] * 1000:.1f} ms -> {seconds * 1000:.1f} ms")
+    return regressions
+
+
+def parse_case(text: str) -> tuple[float, int]:
+    days, _, count = text.partition(':')
+    return float(days), int(count or 15)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark growth plots against a synthetic database, e.g. "
+                                                 "python -m gwaff.benchmark.plot_bench --users 100 --years 2")
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--sample-minutes', type=int, default=60,
+                        help="Minutes between collections in the synthetic data")
+    parser.add_argument('--cases', type=parse_case, nargs='+',
+                        default=[(1, 1), (7, 1), (7, 15), (30, 15), (365, 30)],
+                        help="Plots to time, as days:count")
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--baseline', help="Compare against the results in this JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed slowdown against the baseline, as a fraction")
+    parser.add_argument('--floor', type=float, default=0.005,
+                        help="Slowdowns under this many seconds are ignored")
+    args = parser.parse_args()
+
+    # The database location is read on import, so it must be set first
+    os.environ['DB_NAME'] = os.path.join(tempfile.mkdtemp(prefix='gwaff-bench-'), 'bench.db')
+
+    # Statement logging would dominate the timings
+    logging.getLogger('sqlalchemy.engine.Engine').setLevel(logging.WARNING)
+
+    start = time.perf_counter()
+    records = build_database(args.users, args.years, args.sample_minutes, args.seed)
+    print(f"Built {records} records for {args.users} users in {time.perf_counter() - start:.1f}s")
+
+    from gwaff.plotter.render import warm_worker
+    warm_worker()
+
+    results = []
+    print(f"{'case':>14}{'plotter':>12}" + ''.join(f"{stage:>10}" for stage in STAGES + ['total']) + "  (ms)")
+    for days, count in args.cases:
+        plotter = growth_plotter(count).__name__
+        stages = time_growth(days, count, args.rounds)
+        results.append({'days': days, 'count': count, 'plotter': plotter, 'stages': stages})
+        print(f"{f'{days:g}d x {count}':>14}{plotter:>12}"
+              + ''.join(f"{seconds * 1000:10.1f}" for seconds in stages.values()))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'users': args.users, 'years': args.years, 'sample_minutes': args.sample_minutes,
+                       'records': records, 'cases': results}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline['cases'], args.tolerance, args.floor)
+        for regression in regressions:
+            print(f"Slower than baseline: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
@@ -1,4 +1,6 @@
+import asyncio
 import os
+import time
 from datetime import datetime
 from logging import handlers
 from typing import Any, Callable
@@ -52,6 +54,7 @@ class GwaffBot(commands.Bot):
         self.start_time = None
 
         self.synced = False
+        self.warmup: asyncio.Task | None = None
 
     async def find_channel(self, server_id: str, channel_name: str):
         """
@@ -104,6 +107,8 @@ class GwaffBot(commands.Bot):
         Sets up logging, finds servers and channels, and syncs commands.
         """
         if not self.synced:
+            # Runs alongside the rest of startup, so it is not waiting on the command sync
+            self.warmup = asyncio.create_task(self.warm_up())
             self.scheduler.start()
 
             file_handler = handlers.TimedRotatingFileHandler(f'../discord.log',
@@ -138,6 +143,20 @@ class GwaffBot(commands.Bot):
             self.synced = True
         logger.info("Ready!")
 
+    async def warm_up(self) -> None:
+        """
+        Loads the plotting stack, render workers, database and avatars in the background,
+        so nobody's command waits for them.
+        """
+        start = time.perf_counter()
+        try:
+            from gwaff.plotter.render import warm_up
+            await asyncio.to_thread(warm_up)
+        except Exception as e:
+            logger.warning(f"Warm up failed: {str(e)}")
+            return
+        logger.info(f"Warmed up in {time.perf_counter() - start:.1f}s")
+
     async def on_app_command_completion(self, interaction, command):
         """
         Event handler for when an application command is completed.
@@ -1,3 +1,4 @@
+import asyncio
 import os
 from datetime import datetime, timedelta
 
@@ -7,7 +8,9 @@ from discord.ext import commands
 
 from gwaff.bot import GwaffBot
 from gwaff.cogs.permissions import require_admin
-from gwaff.collector import record_data
+from gwaff.collector import record_data, write_spool, CollectionScheduler, COLLECTION_TICK, TooSoonException
+from gwaff.collector import metrics, refresh_profile_fingerprint
+from gwaff.metrics import sparkline
 from gwaff.custom_logger import Logger
 from gwaff.database.db_base import DatabaseReader, DatabaseSaver
 from gwaff.database.db_reducer import DatabaseReducer
@@ -17,7 +20,20 @@ logger = Logger('gwaff.bot.collector')
 COLLECTION_MAX_TIME: int = int(os.environ.get("MAX_SEPARATION", 120))
 REDUCER_TIMEOUT: int = 60  # Time in seconds before the reducer process times out and is halted.
 
-COLLECTION_SMALL: int = int(os.environ.get("COLLECTION_SMALL", 2))
+# Metric name, label and format shown by /collector metrics
+COLLECTOR_METRICS: list[tuple[str, str, str]] = [
+    ('page_latency', 'Page latency (s)', '.2f'),
+    ('retries', 'HTTP retries', '.0f'),
+    ('fetch_time', 'Fetch time (s)', '.1f'),
+    ('commit_time', 'Commit time (s)', '.2f'),
+    ('wall_time', 'Wall time (s)', '.1f'),
+    ('members', 'Members parsed', '.0f'),
+    ('inserted', 'Rows inserted', '.0f'),
+    ('skipped', 'Rows skipped', '.0f'),
+    ('profiles', 'Profiles updated', '.0f'),
+]
+
+MIN_SEPARATION: int = int(os.environ.get("MIN_SEPARATION", 30))
 COLLECTION_LARGE: int = int(os.environ.get("COLLECTION_LARGE", 6))
 COLLECTION_LARGEST: int = int(os.environ.get("COLLECTION_LARGEST", 10))
 
@@ -114,16 +130,11 @@ async def reduce():
 class CollectorCog(commands.GroupCog, group_name='collector'):
     def __init__(self, bot: GwaffBot):
         self.bot = bot
+        self.scheduler = CollectionScheduler(range(1, COLLECTION_LARGE))
 
         self.bot.schedule_task(
-            self.collect_short,
-            hour='0-23/2',
-            minute=0
-        )
-        self.bot.schedule_task(
-            self.collect_long,
-            hour='1-23/2',
-            minute=0
+            self.collect_adaptive,
+            minute=f'*/{COLLECTION_TICK}'
         )
         self.bot.schedule_task(
             self.update_profiles,
@@ -157,10 +168,10 @@ class CollectorCog(commands.GroupCog, group_name='collector'):
 
         dbr = DatabaseReader()
 
-        last = dbr.get_last_timestamp()
+        last = dbr.get_last_collection()
         last_str = utils.format_dt(last, 'R')
 
-        prev_last = dbr.get_dates_in_range(now - timedelta(days=1))
+        prev_last = dbr.get_collection_times(now - timedelta(days=1))
         if len(prev_last) <= 1:
             prev_last_str = ""
         else:
@@ -175,6 +186,42 @@ class CollectorCog(commands.GroupCog, group_name='collector'):
         await interaction.followup.send(f"Data was last collected {last_str}\n"
                                         f"{prev_last_str}{alive}")
 
+    @app_commands.command(name="metrics",
+                          description="(Admin only) Show timings and counts of recent collections")
+    @require_admin
+    async def show_metrics(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+
+        count = len(metrics.samples)
+        if count == 0:
+            await interaction.followup.send("No collections since the last reboot")
+            return
+
+        lines = [f"{'':<17}{'p50':>8}{'p90':>8}{'p99':>8}  trend"]
+        for key, label, fmt in COLLECTOR_METRICS:
+            summary = metrics.summary(key)
+            if not summary:
+                continue
+            values = ''.join(f"{value:>8{fmt}}" for value in summary.values())
+            lines.append(f"{label:<17}{values}  {sparkline(metrics.series(key), width=20)}")
+        table = "\n".join(lines)
+        await interaction.followup.send(f"Last {count} collections\n```{table}```")
+
+    @app_commands.command(name="schedule",
+                          description="(Admin only) Show how often each page is being collected")
+    @require_admin
+    async def schedule(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+
+        intervals = self.scheduler.intervals()
+        lines = []
+        for page, interval in intervals.items():
+            last = self.scheduler.last_collected.get(page)
+            last_str = utils.format_dt(last, 'R') if last else "never"
+            lines.append(f"Page {page}: activity {self.scheduler.activity[page]:.2f}, "
+                         f"every {round(interval)} minutes, last collected {last_str}")
+        await interaction.followup.send("\n".join(lines))
+
     @app_commands.command(name="reduce", description="(Admin only) Clean up old datapoints")
     @require_admin
     async def reducer_ui(self, interaction: discord.Interaction):
@@ -210,27 +257,42 @@ class CollectorCog(commands.GroupCog, group_name='collector'):
                     return
         dbs.update_profile(member.id, name=nickname, avatar=avatar, colour=colour, colours=colours)
         dbs.commit()
+        # So the next collection compares against the edited profile
+        refresh_profile_fingerprint(member.id)
         await interaction.followup.send(f"Updated profile for <@{member.id}>", ephemeral=True)
 
-    async def collect_short(self):
+    async def collect_adaptive(self):
         """
-        Collects data from a small range of pages.
+        Collects data from the pages that are due according to their recent activity.
         """
-        logger.info("Starting short data collection")
+        pages = self.scheduler.due_pages()
+        if not pages:
+            return
+        logger.info(f"Starting data collection of pages {pages}")
         try:
-            record_data(pages=range(1, COLLECTION_SMALL))
+            # Allow a minute of scheduler jitter between ticks
+            activity = await asyncio.to_thread(record_data, pages=pages,
+                                               min_time=min(MIN_SEPARATION, COLLECTION_TICK) - 1)
+        except TooSoonException:
+            # Another collection ran recently, the pages will still be due next tick
+            return
         except Exception as e:
             await self.bot.send_message(f"Data collection failed! {str(e)}", log=True)
+            return
+        self.scheduler.update(activity)
 
-    async def collect_long(self):
+    @commands.Cog.listener()
+    async def on_ready(self):
         """
-        Collects data from a larger range of pages.
+        Writes any pages left in the spool, e.g. if the bot crashed before saving them.
         """
-        logger.info("Starting long data collection")
         try:
-            record_data(pages=range(1, COLLECTION_LARGE))
+            success, failure, activity = await asyncio.to_thread(write_spool)
         except Exception as e:
-            await self.bot.send_message(f"Data collection failed! {str(e)}", log=True)
+            await self.bot.send_message(f"Writing spooled data failed! {str(e)}", log=True)
+            return
+        if success:
+            logger.info(f"Replayed {success} spooled records")
 
     async def update_profiles(self):
         """
@@ -238,9 +300,12 @@ class CollectorCog(commands.GroupCog, group_name='collector'):
         """
         logger.info("Starting profile update")
         try:
-            record_data(range(1, COLLECTION_LARGEST), min_time=0)
+            activity = await asyncio.to_thread(record_data, range(1, COLLECTION_LARGEST), min_time=0)
         except Exception as e:
             await self.bot.send_message(f"Data collection failed! {str(e)}", log=True)
+            return
+        # These pages were just collected, so they are not due again yet
+        self.scheduler.update(activity)
 
 
 async def setup(bot: GwaffBot):
@@ -1,12 +1,16 @@
 import os
-from datetime import datetime, timedelta
+from io import BytesIO
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 
+from gwaff.cogs.permissions import require_admin
+from gwaff.collector import COLLECTION_TICK
 from gwaff.custom_logger import Logger
-from gwaff.plotter.growth import Growth
+from gwaff.metrics import sparkline
+from gwaff.plotter.plotter import PLOT_FORMAT
+from gwaff.plotter.render import render_service
 from gwaff.utils import resolve_member
 
 logger = Logger('gwaff.bot.plot')
@@ -15,18 +19,22 @@ GRAPH_MAX_DAYS: int = int(os.environ.get("GRAPH_MAX_DAYS", 365))
 GRAPH_DEFAULT_DAYS: int = int(os.environ.get("GRAPH_DEFAULT_DAYS", 7))
 GRAPH_MAX_USERS: int = int(os.environ.get("GRAPH_MAX_USERS", 30))
 GRAPH_DEFAULT_USERS: int = int(os.environ.get("GRAPH_DEFAULT_USERS", 15))
+ACTIVITY_DEFAULT_DAYS: int = min(365, GRAPH_MAX_DAYS)
 
+REGULAR_OFFSET: int = 5  # Minutes after each collection tick to render the regular graph
 
-def growth(days: int = GRAPH_DEFAULT_DAYS,
-           count: int = GRAPH_DEFAULT_USERS,
-           member: discord.User = None,
-           title: str = "Top chatters XP growth",
-           special: bool = False,
-           compare: discord.User = None,
-           name='out.png') -> str:
+GENERATED_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'generated')
+
+
+async def growth(days: int = GRAPH_DEFAULT_DAYS,
+                 count: int = GRAPH_DEFAULT_USERS,
+                 member: discord.User = None,
+                 title: str = "Top chatters XP growth",
+                 special: bool = False,
+                 compare: discord.User = None) -> discord.File:
     """
-    Plots and saves a growth plot (aka gwaff)
-    
+    Plots a growth plot (aka gwaff) in a render worker.
+
     Args:
         days (int): Number of days to plot (default GRAPH_DEFAULT_DAYS).
         count (int): Number of users to plot (default GRAPH_DEFAULT_USERS).
@@ -34,35 +42,25 @@ def growth(days: int = GRAPH_DEFAULT_DAYS,
         title (str): Title of the plot (default "Top chatters XP growth").
         special (bool): Whether to use special plotting settings (default False).
         compare (discord.User): A second user to compare with (default None).
-        name (str): Name of the output file (default 'out.png').
     Returns:
-        str: Path to the saved plot image.
+        discord.File: The plot image, ready to send.
     """
     if days >= GRAPH_MAX_DAYS:
         days = GRAPH_MAX_DAYS
     elif days <= 0:
         days = 0
 
-    plot = Growth(start_date=datetime.now() - timedelta(days=days),
-                  special=special,
-                  title=title)
     if member is None:
         include = None
     else:
         include = {member.id}
     if compare is not None:
         include = {member.id, compare.id}
-        plot.title = f"Comparing growth over the last {round(days)} days"
+        title = f"Comparing growth over the last {round(days)} days"
 
-    plot.draw(limit=count, include=include)
-    plot.draw_events()
-    plot.annotate()
-    plot.configure()
-
-    path = plot.save(name)
-    plot.close()
-
-    return path
+    image = await render_service.growth(days=days, count=count, include=include,
+                                        title=title, special=special)
+    return discord.File(BytesIO(image), filename=f'growth.{PLOT_FORMAT}')
 
 
 class PlotterCog(commands.Cog):
@@ -75,9 +73,25 @@ class PlotterCog(commands.Cog):
         )
         self.bot.tree.add_command(self.growth_ctxmenu)
 
+        # Shortly after each collection, so the default graph is ready before anyone asks
+        self.bot.schedule_task(
+            self.regular,
+            minute=f'{REGULAR_OFFSET}-59/{COLLECTION_TICK}'
+        )
+
+    async def cog_unload(self):
+        render_service.close()
+
     async def regular(self):
+        """
+        Renders the default /gwaff graph, which also leaves it in the render cache.
+        """
         try:
-            growth(name='regular.png')
+            image = await render_service.growth(days=GRAPH_DEFAULT_DAYS, count=GRAPH_DEFAULT_USERS,
+                                                title="Top chatters XP growth", special=True)
+            os.makedirs(GENERATED_DIR, exist_ok=True)
+            with open(os.path.join(GENERATED_DIR, f'regular.{PLOT_FORMAT}'), 'wb') as file:
+                file.write(image)
         except Exception as e:
             logger.error("Regular graph plotting failed!")
             await self.bot.send_message("Regular graph plotting failed!", log=True)
@@ -87,20 +101,95 @@ class PlotterCog(commands.Cog):
     @app_commands.describe(
         days=f'How many days to plot (default {GRAPH_DEFAULT_DAYS})',
         count=f'How many users to plot (default {GRAPH_DEFAULT_USERS})',
+        everyone='Show every active member, labelling only the top users (default False)',
+        race='Animate the top users racing (default False)',
         hidden='Hide from others in this server (default False)')
     async def plot_gwaff(self, interaction: discord.Interaction,
                          days: app_commands.Range[float, 1, GRAPH_MAX_DAYS] = GRAPH_DEFAULT_DAYS,
                          count: app_commands.Range[int, 1, GRAPH_MAX_USERS] = GRAPH_DEFAULT_USERS,
+                         everyone: bool = False,
+                         race: bool = False,
                          hidden: bool = False):
         await interaction.response.defer(ephemeral=hidden)
 
+        if race:
+            try:
+                image = await render_service.race(days=days, count=count,
+                                                  title=f"Top chatters XP race over the last {round(days)} days")
+            except IndexError:
+                await interaction.followup.send(":bust_in_silhouette: Nobody has been online recently enough")
+                return
+            await interaction.followup.send(file=discord.File(BytesIO(image), filename='race.gif'))
+            return
+
+        if everyone:
+            try:
+                image = await render_service.density(days=days, count=count,
+                                                     title=f"Everyone's XP growth over the last {round(days)} days")
+            except IndexError:
+                await interaction.followup.send(":bust_in_silhouette: Nobody has been online recently enough")
+                return
+            await interaction.followup.send(file=discord.File(BytesIO(image), filename=f'growth.{PLOT_FORMAT}'))
+            return
+
         title: str
         if days == GRAPH_DEFAULT_DAYS:
             title = "Top chatters XP growth"
         else:
             title = f"Top chatters XP over the last {round(days)} days"
-        path = growth(days=days, count=count, title=title, special=True)
-        await interaction.followup.send(file=discord.File(path))
+        file = await growth(days=days, count=count, title=title, special=True)
+        await interaction.followup.send(file=file)
+
+    @app_commands.command(name="rendermetrics",
+                          description="(Admin only) Show graph render times and cache usage")
+    @require_admin
+    async def render_metrics(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+
+        metrics = render_service.metrics
+        cache = render_service.cache
+        count = len(metrics.samples)
+        if count == 0:
+            await interaction.followup.send("No graphs since the last reboot")
+            return
+
+        summary = metrics.summary('render_time')
+        values = ''.join(f"{value:>8.2f}" for value in summary.values())
+        table = (f"{'':<17}{'p50':>8}{'p90':>8}{'p99':>8}  trend\n"
+                 f"{'Render time (s)':<17}{values}  {sparkline(metrics.series('render_time'), width=20)}")
+        await interaction.followup.send(f"Last {count} graphs\n```{table}```\n"
+                                        f"Cache hit rate {cache.hit_rate():.0%} "
+                                        f"({cache.hits} hits, {cache.shared} shared, {cache.misses} misses), "
+                                        f"holding {len(cache.images)} graphs in "
+                                        f"{cache.bytes / 1024 / 1024:.1f} MB")
+
+    @app_commands.command(name="activity",
+                          description="Plots a calendar of daily activity")
+    @app_commands.describe(member="The member to plot (default everyone)",
+                           days=f'How many days to plot (default {ACTIVITY_DEFAULT_DAYS})',
+                           hidden="Hide from others in this server (default False)")
+    async def plot_activity(self, interaction: discord.Interaction,
+                            member: discord.User = None,
+                            days: app_commands.Range[int, 7, GRAPH_MAX_DAYS] = ACTIVITY_DEFAULT_DAYS,
+                            hidden: bool = False):
+        await interaction.response.defer(ephemeral=hidden)
+        if member is None:
+            member_id, title = None, f"Server activity over the last {days} days"
+        else:
+            member = resolve_member(interaction, member)
+            if member is False:
+                await interaction.followup.send(":bust_in_silhouette: "
+                                                "That person in not in the server "
+                                                "or hasn't reached level 15")
+                return
+            member_id, title = member.id, f"{member.name}'s activity over the last {days} days"
+
+        try:
+            image = await render_service.activity(days=days, member=member_id, title=title)
+        except IndexError:
+            await interaction.followup.send(":bust_in_silhouette: Nobody has been online recently enough")
+            return
+        await interaction.followup.send(file=discord.File(BytesIO(image), filename=f'activity.{PLOT_FORMAT}'))
 
     @app_commands.command(name="growth",
                           description="Plots a specific member's growth")
@@ -132,15 +221,15 @@ class PlotterCog(commands.Cog):
                 return
 
         try:
-            path = growth(days=days, member=member, count=1,
-                          title=f"{member.name}'s growth over the last {round(days)} days",
-                          compare=co_member)
+            file = await growth(days=days, member=member, count=1,
+                                title=f"{member.name}'s growth over the last {round(days)} days",
+                                compare=co_member)
         except IndexError:
             await interaction.followup.send(":bust_in_silhouette: "
                                             "That person has not been online "
                                             "recently enough")
             return
-        await interaction.followup.send(file=discord.File(path))
+        await interaction.followup.send(file=file)
 
     async def growth_ctx(self, interaction: discord.Interaction,
                          member: discord.Member):
@@ -152,14 +241,14 @@ class PlotterCog(commands.Cog):
                                             "or hasn't reached level 15")
             return
         try:
-            path = growth(days=GRAPH_DEFAULT_DAYS, member=member, count=1,
-                          title=f"{member.name}'s growth over the last {round(GRAPH_DEFAULT_DAYS)} days")
+            file = await growth(days=GRAPH_DEFAULT_DAYS, member=member, count=1,
+                                title=f"{member.name}'s growth over the last {round(GRAPH_DEFAULT_DAYS)} days")
         except IndexError:
             await interaction.followup.send(":bust_in_silhouette: "
                                             "That person has not been online "
                                             "recently enough")
             return
-        await interaction.followup.send(file=discord.File(path))
+        await interaction.followup.send(file=file)
 
 
 async def setup(bot: commands.Bot):
@@ -9,6 +9,7 @@ from discord.ext import commands
 from gwaff.custom_logger import Logger
 from gwaff.predictor import NoDataError, ZeroGrowthError, TargetBoundsError
 from gwaff.predictor import TargetPrediction, xp_to_lvl, MAX_TARGET_DISTANCE, Forecast
+from gwaff.predictor import Threats, THREATS_DEFAULT_COUNT
 from gwaff.utils import resolve_member, to_suffixed_number
 
 logger = Logger('gwaff.bot.stats')
@@ -18,6 +19,7 @@ PREDICTOR_DEFAULT_DAYS: int = int(os.environ.get("PREDICTOR_DEFAULT_DAYS", 30))
 RANK_DEFAULT_THRESHOLD: int = int(os.environ.get("RANK_DEFAULT_THRESHOLD", 30))
 RANK_MAX_PAGE: int = 5
 RANK_PAGE_SIZE: int = 25
+THREATS_MAX_COUNT: int = 20
 ACCENT_COLOUR: str = '#ea625e'
 
 
@@ -153,18 +155,72 @@ class PredictCog(commands.GroupCog, group_name='predict'):
         member_name = "You" if member is interaction.user else f"<@{member.id}>"
 
         level = xp_to_lvl(xp)
-        if xp <= 12017 or level > 100:
-            await interaction.followup.send(f"{member_name} will have {to_suffixed_number(xp)} xp on "
-                                            f"<t:{round(date)}:D> <t:{round(date)}:R> "
-                                            f"at a rate of {to_suffixed_number(forecast.growth)} "
-                                            f"xp per day")
-            return
-
         await interaction.followup.send(f"{member_name} will be level {level} ({to_suffixed_number(xp)} xp) on "
                                         f"<t:{round(date)}:D> <t:{round(date)}:R> "
                                         f"at a rate of {to_suffixed_number(forecast.growth)} "
                                         f"xp per day")
 
+    @app_commands.command(name="threats",
+                          description="Predict who will overtake you, and who you will overtake")
+    @app_commands.describe(member='The member to do the prediction for'
+                                  ' (default you)',
+                           period='The period to average growth over'
+                                  ' (default 30 days)',
+                           count=f'How many of each to show (default {THREATS_DEFAULT_COUNT})',
+                           growth='Override the average daily growth calculation',
+                           hidden='Hide from others in this server (default False)')
+    async def predict_threats(self, interaction: discord.Interaction,
+                              member: discord.User = None,
+                              period: app_commands.Range[
+                                  int, 1, GRAPH_MAX_DAYS] = PREDICTOR_DEFAULT_DAYS,
+                              count: app_commands.Range[
+                                  int, 1, THREATS_MAX_COUNT] = THREATS_DEFAULT_COUNT,
+                              growth: int = None,
+                              hidden: bool = False):
+        await interaction.response.defer(ephemeral=hidden)
+
+        member = resolve_member(interaction, member)
+        if member is False:
+            await interaction.followup.send(":bust_in_silhouette: "
+                                            "That person in not in the server "
+                                            "or hasn't reached level 15")
+            return
+
+        try:
+            prediction = Threats(member=member.id,
+                                 period=period,
+                                 growth=growth)
+            threats, targets = prediction.evaluate(count=count)
+
+        except NoDataError:
+            await interaction.followup.send(":bust_in_silhouette: "
+                                            "That person has not been online "
+                                            "recently enough")
+            return
+        except Exception as e:
+            await interaction.followup.send(f":question: An unknown error occurred:\n {e}")
+            raise e
+
+        if not threats and not targets:
+            await interaction.followup.send(":telescope: "
+                                            "Nobody is close enough to pass or be passed at this rate")
+            return
+
+        def describe(results: list[tuple[int, float]]) -> str:
+            lines = []
+            for id, days in results:
+                date = round(mktime((datetime.now() + timedelta(days=days)).timetuple()))
+                lines.append(f"<@{id}> <t:{date}:D> <t:{date}:R>")
+            return '\n'.join(lines) or 'Nobody'
+
+        embed = discord.Embed(title=f"{member.name}'s threats and targets",
+                              description=f"At a rate of {to_suffixed_number(prediction.growth)} "
+                                          f"xp per day over the last {period} days",
+                              colour=discord.Colour.from_str(ACCENT_COLOUR))
+        embed.add_field(name='Catching up', value=describe(threats), inline=False)
+        embed.add_field(name='Being caught', value=describe(targets), inline=False)
+        await interaction.followup.send(embed=embed)
+
 
 async def setup(bot: commands.Bot):
     """
@@ -1,7 +1,6 @@
 from typing import Any
 
 import discord
-import requests
 from discord import app_commands
 from discord.ext import commands
 
@@ -9,6 +8,7 @@ from gwaff.bot import GwaffBot
 from gwaff.custom_logger import Logger
 from gwaff.database.db_spooncraft import DatabaseMinecraft
 from gwaff.cogs.permissions import require_admin
+from gwaff.utils import get_session
 
 logger = Logger('gwaff.bot.spooncraft')
 
@@ -21,8 +21,8 @@ def update_data(url: str, new_data: dict[str, Any]) -> bool:
         url (str): URL to upload the data to.
         new_data (dict): The new data to update.
     """
-    headers = {'Content-Type': 'application/json', "User-Agent": "Mozilla/5.0"}
-    response = requests.post(url, json=new_data, headers=headers)
+    headers = {'Content-Type': 'application/json'}
+    response = get_session().post(url, json=new_data, headers=headers, timeout=30)
     if response.status_code == 200:
         logger.info(f"Data updated successfully: {response.json()}")
         return True
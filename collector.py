@@ -1,12 +1,16 @@
 import os
 import time
-from datetime import datetime
-from threading import Thread
-from typing import Iterable
+from datetime import datetime, timedelta
+from threading import Lock, Thread
+from typing import Iterable, Iterator
 
-from gwaff.database.db_base import DatabaseReader, DatabaseSaver
+from gwaff.database.db_base import (DatabaseReader, DatabaseSaver,
+                                    RECORD_KEYFRAME_HOURS, COLLECTION_MAX_INTERVAL)
+from gwaff.database.db_events import DatabaseEvents
 from gwaff.custom_logger import Logger
-from gwaff.utils import request_api
+from gwaff.metrics import MetricsHistory
+from gwaff.spool import Spool
+from gwaff.utils import request_api_stream
 
 logger = Logger('gwaff.collect')
 
@@ -16,13 +20,143 @@ WAIT_SUCCESS: int = 60  # How many minutes to wait after a success. Deprecated.
 WAIT_FAIL: int = 30  # How many minutes to wait after a failure. Deprecated.
 
 MIN_SEPARATION: int = int(os.environ.get("MIN_SEPARATION", 30))
+MAX_SEPARATION: int = int(os.environ.get("MAX_SEPARATION", 120))
 COLLECTION_SMALL: int = int(os.environ.get("COLLECTION_SMALL", 2))
 COLLECTION_LARGE: int = int(os.environ.get("COLLECTION_LARGE", 6))
 COLLECTION_LARGEST: int = int(os.environ.get("COLLECTION_LARGEST", 10))
 
+COLLECTION_TICK: int = int(os.environ.get("COLLECTION_TICK", 30))  # Minutes between scheduler checks
+COLLECTION_BUDGET: int = int(os.environ.get("COLLECTION_BUDGET",
+                                            12 * (COLLECTION_SMALL + COLLECTION_LARGE - 2)))  # Pages per day
+ACTIVITY_SMOOTHING: float = 0.5  # Weight of the latest collection in a page's activity
+SPOOL_FLUSH_SIZE: int = 100  # Members to hold in memory before appending them to the spool
+
+API_PAGE_SIZE: int = int(os.environ.get("API_PAGE_SIZE", 100))  # Members per page of the API
+
 SERVER_ID = os.environ.get("TRACKING_SERVER")
 API_URL = os.environ.get("API_URL")
 
+# The last stored record and last seen time of each profile, as [stored time, value, seen time].
+# Seeded from the database on the first collection.
+last_values: dict[int, list] | None = None
+# The leaderboard position of each profile when it was last collected.
+last_ranks: dict[int, int] = {}
+# Each profile's fields as they were last saved, see profile_fingerprint.
+# Seeded from the database on the first collection.
+profile_fingerprints: dict[int, tuple] | None = None
+
+# Fetched pages waiting to be written to the database.
+spool = Spool()
+write_lock = Lock()
+
+# Timings and counts of recent collections, see record_data.
+metrics = MetricsHistory()
+
+
+def get_last_values() -> dict[int, list]:
+    """
+    Gets the in-memory map of each profile's last stored value, seeding it from the database.
+
+    Returns:
+        dict: A mapping of profile ID to [stored time, value, seen time].
+    """
+    global last_values
+    if last_values is None:
+        last_values = {id: [timestamp, value, timestamp]
+                       for id, (timestamp, value) in DatabaseReader().get_last_values().items()}
+        logger.info(f"Seeded last values for {len(last_values)} profiles")
+    return last_values
+
+
+def profile_fingerprint(name: str | None, colour: str | None, avatar: str | None,
+                        colours: list[str] | str | None, stored: tuple | None = None) -> tuple:
+    """
+    Finds a profile's fields as DatabaseSaver.update_profile would store them, to tell whether
+    saving them would change anything. As there, missing fields keep their stored values.
+
+    Args:
+        name (str): The name of the profile.
+        colour (str): The colour of the profile.
+        avatar (str): The avatar URL of the profile.
+        colours (list[str] | str): The colours of the profile, as a list or as stored.
+        stored (tuple, optional): The fingerprint of the stored profile, if there is one.
+
+    Returns:
+        tuple: The fingerprint.
+    """
+    if isinstance(colours, list):
+        colours = ','.join(colours)
+    fields = (name, colour, avatar, colours or None)
+    if stored is None:
+        return fields
+    return tuple(field or previous for field, previous in zip(fields, stored))
+
+
+def get_profile_fingerprints() -> dict[int, tuple]:
+    """
+    Gets the in-memory map of profile fingerprints, seeding it from the database.
+
+    Returns:
+        dict: A mapping of profile ID to fingerprint.
+    """
+    global profile_fingerprints
+    if profile_fingerprints is None:
+        profile_fingerprints = {
+            profile.id: profile_fingerprint(profile.name, profile.colour, profile.avatar, profile.colours)
+            for profile in DatabaseReader().get_profile_data()}
+        logger.info(f"Seeded fingerprints for {len(profile_fingerprints)} profiles")
+    return profile_fingerprints
+
+
+def refresh_profile_fingerprint(member_id: int) -> None:
+    """
+    Reloads a profile's fingerprint from the database, after it was changed outside a collection.
+
+    Args:
+        member_id (int): The ID of the profile.
+    """
+    if profile_fingerprints is None:
+        return
+    profile = DatabaseReader().get_profile_data(member_id)
+    if profile is None:
+        profile_fingerprints.pop(member_id, None)
+        return
+    profile_fingerprints[member_id] = profile_fingerprint(profile.name, profile.colour,
+                                                          profile.avatar, profile.colours)
+
+
+def changed_records(member_id: int, now: datetime, xp: int) -> list[tuple[int, datetime, int]]:
+    """
+    Determines which records need to be stored for a new sample.
+    A record is only stored when the xp changes, or if the last stored record is older than
+    RECORD_KEYFRAME_HOURS. When the xp changes after unstored samples, the held value is also
+    stored at the last time it was seen so the series keeps its shape.
+
+    Args:
+        member_id (int): The ID of the profile.
+        now (datetime): The time of the sample.
+        xp (int): The xp at the time of the sample.
+
+    Returns:
+        list: The records to store, as tuples of (id, timestamp, value).
+    """
+    last = get_last_values().get(member_id)
+    if last is None:
+        return [(member_id, now, xp)]
+
+    stored_time, value, seen_time = last
+    if now <= stored_time:
+        # Already stored, e.g. when replaying the spool
+        return []
+    if xp == value:
+        if now - stored_time < timedelta(hours=RECORD_KEYFRAME_HOURS):
+            return []
+        return [(member_id, now, xp)]
+
+    if seen_time > stored_time:
+        return [(member_id, seen_time, value), (member_id, now, xp)]
+    return [(member_id, now, xp)]
+
 
 class TooSoonException(Exception):
     """
@@ -38,82 +172,390 @@ class ManyFailuresException(Exception):
     pass
 
 
-def record_data(pages: Iterable[int] = range(1, COLLECTION_LARGE),
-                min_time: int = MIN_SEPARATION, add_records=True) -> None:
+def fetch_pages(pages: Iterable[int], now: datetime, add_records: bool = True,
+                sample: dict = None) -> int:
     """
-    Record the current XP data and ensure records are separated by at least min_time minutes.
+    Requests each page from the API and appends its members to the spool as they arrive.
+    Each member is spooled separately, so only SPOOL_FLUSH_SIZE members are held in memory.
+    If a page stops partway through, it is requested again and the members already
+    spooled are skipped, up to MAX_RETRIES times.
 
     Args:
-        pages (Iterable[int]): The pages to collect data from. Defaults to range(1, COLLECTION_LARGE).
-        min_time (int): Minimum time in minutes between data collections. Defaults to MIN_SEPARATION.
-        add_records (bool): Whether to add records to the database. Defaults to True.
+        pages (Iterable[int]): The pages to collect data from.
+        now (datetime): The time of the collection.
+        add_records (bool): Whether records should be added for these pages. Defaults to True.
+        sample (dict, optional): If given, the page latencies and retries are stored in it.
 
-    Throws:
-        TooSoonException: If the collection time was too close to previous time
-        ManyFailuresException: If there were many errors when updating records.
-        Exception (db.commit): If there was an error while commiting the data to the db.
+    Returns:
+        int: The number of pages that could not be fully fetched.
     """
-    logger.info("Starting data collection")
+    failed = 0
+    latencies, retries = [], 0
+    for page in pages:
+        start = time.perf_counter()
+        received = 0
+        for attempt in range(MAX_RETRIES):
+            stats = {}
+            members = request_api_stream(API_URL, stats=stats, page=page)
+            retries += stats.get('attempts', 1) - 1
+            if members is None:
+                logger.error("Skipping page after max retries")
+                failed += 1
+                break
+
+            buffer = []
+            try:
+                for index, member in enumerate(members):
+                    if index < received:
+                        continue
+                    buffer.append({'timestamp': now.isoformat(), 'page': page, 'index': index,
+                                   'page_size': API_PAGE_SIZE, 'add_records': add_records,
+                                   'member': member})
+                    received = index + 1
+                    if len(buffer) >= SPOOL_FLUSH_SIZE:
+                        spool.extend(buffer)
+                        buffer = []
+            except Exception as e:
+                # Anything received before the failure is still kept
+                logger.warning(f"Failed to read page {page} (attempt {attempt + 1}): {str(e)}")
+                retries += 1
+                continue
+            finally:
+                # Releases the connection before any retry
+                members.close()
+                if buffer:
+                    spool.extend(buffer)
+            break
+        else:
+            logger.error(f"Skipping the rest of page {page} after max retries")
+            failed += 1
+        latencies.append(time.perf_counter() - start)
+
+    if sample is not None:
+        sample['page_latency'] = latencies
+        sample['retries'] = retries
+        sample['failed_pages'] = failed
+    return failed
+
+
+def spooled_members(entries: list[dict]) -> Iterator[tuple[datetime, int, int, bool, dict]]:
+    """
+    Unpacks spooled entries into individual members, working out each member's leaderboard position.
+    Positions use the page size of the API rather than the number of members received,
+    so a short or incomplete page does not shift the pages after it.
+
+    Args:
+        entries (list): The spooled entries, either single members or whole pages.
+
+    Returns:
+        Iterator: Tuples of (time, page, rank, add records, member).
+    """
+    for entry in entries:
+        now = datetime.fromisoformat(entry['timestamp'])
+        page = entry['page']
+        add_records = entry.get('add_records', True)
+        page_size = entry.get('page_size', API_PAGE_SIZE)
+        if 'member' in entry:
+            members = [(entry['index'], entry['member'])]
+        else:
+            members = enumerate(entry['data'].get('members', []))
+        for index, member in members:
+            yield now, page, (page - 1) * page_size + index, add_records, member
 
-    # Check if enough time has passed since the last collection
-    lasttime = DatabaseReader().get_last_timestamp()
-    now = datetime.now()
-    if (now - lasttime).total_seconds() < min_time * 60:
-        logger.info(f"Too soon - {int((now - lasttime).total_seconds() / 60)}/{min_time} minutes required")
-        raise TooSoonException(f"Too soon - {int((now - lasttime).total_seconds() / 60)}/{min_time} minutes required")
 
+def write_batch(entries: list[dict], sample: dict = None) -> tuple[int, int, dict[int, float]]:
+    """
+    Saves a batch of spooled members to the database in a single commit.
+    The last values and ranks are only updated once the commit succeeds.
+
+    Args:
+        entries (list): The spooled entries to save.
+        sample (dict, optional): If given, the member and row counts and commit time are added to it.
+
+    Returns:
+        tuple: The number of members saved, the number of failures, and the activity of each page.
+
+    Throws:
+        Exception (db.commit): If there was an error while commiting the data to the db.
+    """
     dbi = DatabaseSaver()
     success, failure = 0, 0
+    inserted, skipped = 0, 0
+    profiles_written = 0
+    fingerprints: dict[int, tuple] = {}
+    seen: dict[int, tuple[datetime, int]] = {}
+    stored: set[int] = set()
+    ranks: dict[int, int] = {}
+    activity: dict[int, float] = {}
 
-    # Collect data from pages
-    for page in pages:
-        data = request_api(API_URL, page=page)
-        if not data:
-            logger.error("Skipping page after max retries")
-            failure += 100
+    changes: dict[int, list[int]] = {}
+    for now, page, rank, add_records, member in spooled_members(entries):
+        member_id, xp = member.get('id'), member.get('xp')
+        name = member.get('displayname') or member.get('username')
+        if not all([member_id, xp]):
+            logger.warning(f"Skipping record with missing data")
+            failure += 1
             continue
 
-        for member in data.get('members', []):
+        ranks[int(member_id)] = rank
+        last = get_last_values().get(int(member_id))
+        page_changes = changes.setdefault(page, [0, 0, 0])
+        page_changes[0] += last is None or last[1] != int(xp)
+        page_changes[1] += last_ranks.get(int(member_id)) != rank
+        page_changes[2] += 1
 
-            member_id, xp = member.get('id'), member.get('xp')
-            name = member.get('displayname') or member.get('username')
-            if not all([member_id, xp]):
-                logger.warning(f"Skipping record with missing data")
-                failure += 1
-                continue
+        try:
+            if add_records and int(member_id) not in seen:
+                records = changed_records(int(member_id), now, int(xp))
+                for record in records:
+                    dbi.insert_record(*record)
+                if records:
+                    stored.add(int(member_id))
+                    inserted += len(records)
+                else:
+                    skipped += 1
+                seen[int(member_id)] = (now, int(xp))
+            previous = fingerprints.get(int(member_id), get_profile_fingerprints().get(int(member_id)))
+            fingerprint = profile_fingerprint(name, member.get('color'), member.get('avatar'),
+                                              member.get('colors', None), stored=previous)
+            if fingerprint != previous:
+                dbi.update_profile(int(member_id), name, member.get('color'), member.get('avatar'),
+                                   member.get('colors', None), timestamp=now)
+                fingerprints[int(member_id)] = fingerprint
+                profiles_written += 1
+            success += 1
+        except Exception as e:
+            logger.warning(f"Failed to add record: {str(e)}")
+            failure += 1
+
+    for page, (xp_changes, rank_changes, count) in changes.items():
+        activity[page] = (xp_changes + rank_changes) / (2 * count)
+
+    # Unchanged values are not stored, so the collection itself is noted to show they were held
+    if any(entry.get('add_records', True) for entry in entries):
+        dbi.insert_collection(datetime.fromisoformat(entries[0]['timestamp']))
+
+    commit_start = time.perf_counter()
+    dbi.commit()
+    commit_time = time.perf_counter() - commit_start
+
+    # Only update the last values once they are safely in the database
+    values = get_last_values()
+    for member_id, (now, xp) in seen.items():
+        if member_id in stored:
+            values[member_id] = [now, xp, now]
+        else:
+            values[member_id][2] = now
+    last_ranks.update(ranks)
+    get_profile_fingerprints().update(fingerprints)
+    logger.info(f"Inserted {inserted} records, skipped {skipped} unchanged, "
+                f"updated {profiles_written} profiles")
+
+    if sample is not None:
+        sample['members'] = sample.get('members', 0) + success + failure
+        sample['inserted'] = sample.get('inserted', 0) + inserted
+        sample['skipped'] = sample.get('skipped', 0) + skipped
+        sample['profiles'] = sample.get('profiles', 0) + profiles_written
+        sample['commit_time'] = sample.get('commit_time', 0) + commit_time
+    return success, failure, activity
+
+
+def write_spool(sample: dict = None) -> tuple[int, int, dict[int, float]]:
+    """
+    Drains the spool into the database, one collection per commit.
+    A collection that still cannot be saved after retries is quarantined, see Spool.quarantine,
+    and counted as failures. Anything not yet attempted stays in the spool if the bot stops.
+
+    Args:
+        sample (dict, optional): If given, the write metrics are added to it. See write_batch.
+
+    Returns:
+        tuple: The number of members saved, the number of failures, and the activity of each page.
+    """
+    success, failure = 0, 0
+    activity: dict[int, float] = {}
+
+    with write_lock:
+        entries = spool.take()
+        if entries:
+            logger.info(f"Writing {len(entries)} spooled pages")
+
+        while entries:
+            # Each collection shares a timestamp and is saved together
+            timestamp = entries[0]['timestamp']
+            batch = [entry for entry in entries if entry['timestamp'] == timestamp]
 
-            # Retry updating profile and inserting record
             for attempt in range(MAX_RETRIES):
                 try:
-                    if add_records:
-                        dbi.insert_record(int(member_id), now, int(xp))
-                    dbi.update_profile(int(member_id), name, member.get('color'), member.get('avatar'),
-                                       member.get('colors', None))
-                    success += 1
+                    batch_success, batch_failure, batch_activity = write_batch(batch, sample)
                     break
                 except Exception as e:
-                    logger.warning(f"Failed to add record (attempt {attempt + 1}): {str(e)}")
-                    failure += 1
-                    break
+                    logger.warning(f"Failed to commit database (attempt {attempt + 1}): {str(e)}")
+                    if sample is not None:
+                        sample['commit_retries'] = sample.get('commit_retries', 0) + 1
+                    time.sleep(1 << attempt)
+                    continue
             else:
-                logger.error(f"Skipping record after max retries")
+                # Set the batch aside so it cannot block every later collection
+                spool.quarantine(batch)
+                logger.error(f"Failed to commit database after retries, "
+                             f"moved {len(batch)} spooled entries to {spool.quarantine_path}")
+                if sample is not None:
+                    sample['quarantined'] = sample.get('quarantined', 0) + len(batch)
+                batch_success, batch_failure, batch_activity = 0, len(batch), {}
 
-    # Commit changes with retries
-    for attempt in range(MAX_RETRIES):
-        try:
-            dbi.commit()
-            break
-        except Exception as e:
-            logger.warning(f"Failed to commit database (attempt {attempt + 1}): {str(e)}")
-            continue
-    else:
-        raise Exception("Failed to commit database after retries")
+            success += batch_success
+            failure += batch_failure
+            activity.update(batch_activity)
+
+            entries = [entry for entry in entries if entry['timestamp'] != timestamp]
+            spool.done(entries)
+
+    return success, failure, activity
+
+
+def record_data(pages: Iterable[int] = range(1, COLLECTION_LARGE),
+                min_time: int = MIN_SEPARATION, add_records=True) -> dict[int, float]:
+    """
+    Record the current XP data and ensure records are separated by at least min_time minutes.
+    Pages are first fetched into the spool, then the spool is written to the database.
+
+    Args:
+        pages (Iterable[int]): The pages to collect data from. Defaults to range(1, COLLECTION_LARGE).
+        min_time (int): Minimum time in minutes between data collections. Defaults to MIN_SEPARATION.
+        add_records (bool): Whether to add records to the database. Defaults to True.
+
+    Returns:
+        dict: The activity of each collected page, from 0 (no xp or rank changes) to 1.
+
+    Throws:
+        TooSoonException: If the collection time was too close to previous time
+        ManyFailuresException: If there were many errors when updating records.
+    """
+    logger.info("Starting data collection")
+
+    # Check if enough time has passed since the last collection
+    lasttime = DatabaseReader().get_last_collection()
+    now = datetime.now()
+    if lasttime is not None and (now - lasttime).total_seconds() < min_time * 60:
+        logger.info(f"Too soon - {int((now - lasttime).total_seconds() / 60)}/{min_time} minutes required")
+        raise TooSoonException(f"Too soon - {int((now - lasttime).total_seconds() / 60)}/{min_time} minutes required")
+
+    sample = {'time': now}
+    start = time.perf_counter()
+    try:
+        failed_pages = fetch_pages(pages, now, add_records, sample)
+        sample['fetch_time'] = time.perf_counter() - start
+        success, failure, activity = write_spool(sample)
+    finally:
+        sample['wall_time'] = time.perf_counter() - start
+        metrics.add(sample)
+    failure += 100 * failed_pages
 
     if success > failure:
         logger.info("Successfully saved the latest data!")
     else:
         logger.error("Considerable record save failures!")
         raise ManyFailuresException("Considerable record save failures!")
+    return activity
+
+
+class CollectionScheduler:
+    """
+    Chooses which pages to collect based on how active each page has been recently.
+    Busy pages are collected as often as every MIN_SEPARATION minutes, quiet pages
+    as rarely as every COLLECTION_MAX_INTERVAL minutes. Intervals are stretched to keep within
+    COLLECTION_BUDGET pages per day, and shorten during events, when the budget is multiplied too.
+
+    Attributes:
+        pages (range): The pages that may be collected.
+        activity (dict): The smoothed activity of each page, from 0 to 1.
+        last_collected (dict): The last time each page was collected.
+    """
+
+    def __init__(self, pages: range = range(1, COLLECTION_LARGE)):
+        """
+        Initialises the scheduler. Every page starts as active so that it is collected
+        on the first check.
+
+        Args:
+            pages (range, optional): The pages that may be collected. Defaults to range(1, COLLECTION_LARGE).
+        """
+        self.pages = pages
+        self.activity: dict[int, float] = {page: 1.0 for page in pages}
+        self.last_collected: dict[int, datetime] = {}
+
+    def interval(self, page: int, multiplier: float = 1) -> float:
+        """
+        Finds the number of minutes to wait between collections of a page.
+
+        Args:
+            page (int): The page.
+            multiplier (float, optional): The current event multiplier. Defaults to 1.
+
+        Returns:
+            float: The interval in minutes.
+        """
+        quietness = 1 - self.activity.get(page, 1.0)
+        interval = MIN_SEPARATION + quietness * (COLLECTION_MAX_INTERVAL - MIN_SEPARATION)
+        return max(interval / max(multiplier, 1), MIN_SEPARATION)
+
+    def intervals(self) -> dict[int, float]:
+        """
+        Finds the interval of every page, scaled to keep within the budget.
+
+        Returns:
+            dict: A mapping of page to interval in minutes.
+        """
+        event = DatabaseEvents().get_current_event()
+        multiplier = event.multiplier if event and event.multiplier else 1
+
+        intervals = {page: self.interval(page, multiplier) for page in self.pages}
+        # The budget grows with the multiplier, so scaling cannot undo the shorter intervals of an event
+        budget = COLLECTION_BUDGET * max(multiplier, 1)
+        per_day = sum(24 * 60 / i for i in intervals.values())
+        if per_day > budget:
+            scale = per_day / budget
+            # Values are only held for COLLECTION_MAX_INTERVAL past a keyframe, see RECORD_HOLD_LIMIT
+            intervals = {page: min(i * scale, COLLECTION_MAX_INTERVAL) for page, i in intervals.items()}
+
+        # Keep collecting the first page often enough that collection is not considered halted
+        first = self.pages[0]
+        intervals[first] = min(intervals[first], MAX_SEPARATION / 2)
+        return intervals
+
+    def due_pages(self, now: datetime = None) -> list[int]:
+        """
+        Finds the pages that are due to be collected.
+
+        Args:
+            now (datetime, optional): The current time. Defaults to datetime.now().
+
+        Returns:
+            list: The pages to collect.
+        """
+        now = now or datetime.now()
+        # Allow a tick of slack so pages are not pushed back a whole tick by jitter
+        slack = timedelta(minutes=COLLECTION_TICK / 2)
+        return [page for page, interval in self.intervals().items()
+                if page not in self.last_collected
+                or now - self.last_collected[page] + slack >= timedelta(minutes=interval)]
+
+    def update(self, activity: dict[int, float], now: datetime = None) -> None:
+        """
+        Updates the activity of the collected pages. Pages that are not scheduled are ignored.
+
+        Args:
+            activity (dict): The activity of each collected page, as returned by record_data.
+            now (datetime, optional): The time of the collection. Defaults to datetime.now().
+        """
+        now = now or datetime.now()
+        for page, value in activity.items():
+            if page not in self.pages:
+                continue
+            previous = self.activity.get(page, value)
+            self.activity[page] = ACTIVITY_SMOOTHING * value + (1 - ACTIVITY_SMOOTHING) * previous
+            self.last_collected[page] = now
 
 
 def run() -> None:
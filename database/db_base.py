@@ -12,6 +12,13 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_NAME = os.environ.get('DB_NAME', 'gwaff.db')
 DB_DIR = os.path.join(BASE_DIR, DB_NAME)
 
+# Records are only stored when the xp changes, plus a keyframe at least this often.
+RECORD_KEYFRAME_HOURS: int = int(os.environ.get("RECORD_KEYFRAME_HOURS", 6))
+COLLECTION_MAX_INTERVAL: int = int(os.environ.get("COLLECTION_MAX_INTERVAL", 360))  # Minutes
+# The keyframe is stored at the first collection after RECORD_KEYFRAME_HOURS, which may be a whole
+# collection interval later. Gaps shorter than this are treated as the value being held.
+RECORD_HOLD_LIMIT = timedelta(hours=RECORD_KEYFRAME_HOURS, minutes=COLLECTION_MAX_INTERVAL)
+
 print(BASE_DIR)
 print(DB_NAME)
 print(DB_DIR)
@@ -59,8 +66,10 @@ class DatabaseCreator(BaseDatabase):
         """
         Profile.__table__.drop(self.engine, checkfirst=True)
         Record.__table__.drop(self.engine, checkfirst=True)
+        ProfileHistory.__table__.drop(self.engine, checkfirst=True)
         MinecraftUser.__table__.drop(self.engine, checkfirst=True)
         Event.__table__.drop(self.engine, checkfirst=True)
+        Collection.__table__.drop(self.engine, checkfirst=True)
 
         self.session.commit()
 
@@ -78,6 +87,14 @@ class DatabaseReader(BaseDatabase):
     Class for reading data from the database.
     """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # The last collection time, cached for holding row endpoints.
+        self._last_collection: datetime | None = None
+        # The ends of rows already looked up, by ID and range.
+        self._endpoints: dict[tuple, list[Record]] = {}
+
     def get_dates_in_range(self, start_date=None, end_date=None) -> list[datetime]:
         """
         Retrieves distinct timestamps within a specified date range.
@@ -97,7 +114,8 @@ class DatabaseReader(BaseDatabase):
         return [i.timestamp for i in query_result.order_by(Record.timestamp).all()]
 
     def get_row(self, id: int,
-                start_date: datetime = None, end_date: datetime = None) -> list[Record]:
+                start_date: datetime = None, end_date: datetime = None,
+                hold: bool = True) -> list[Record]:
         """
         Retrieves records for a specific ID, optionally filtering by start date.
 
@@ -105,19 +123,13 @@ class DatabaseReader(BaseDatabase):
             id (int): The ID of the record.
             start_date (datetime, optional): The start date for filtering records.
             end_date (datetime, optional): The end date for filtering records.
+            hold (bool, optional): Whether to extend the row with held values. Defaults to True.
 
         Returns:
             list: A list of records for the specified ID.
         """
-        if id == 483515866319945728 and start_date < datetime(2024, 6, 2):
-            if end_date is None or datetime(2024, 6, 1) < end_date:
-                return []
-        elif id == 457989277322838016 and start_date < datetime(2025, 1, 20):
-            if end_date is None or datetime(2025, 1, 19) < end_date:
-                return []
-        elif id == 930180605612810310 and start_date < datetime(2025, 11, 30):
-            if end_date is None or datetime(2025, 11, 29) < end_date:
-                return []
+        if self.is_hidden(id, start_date, end_date):
+            return []
         record_query = (self.session.query(Record)
                         .filter_by(id=id)
                         .order_by(Record.timestamp))
@@ -127,7 +139,113 @@ class DatabaseReader(BaseDatabase):
             record_query = record_query.filter(Record.timestamp <= end_date)
 
         # Execute the query for records
-        return record_query.all()
+        records = record_query.all()
+        if hold:
+            records = self.hold_endpoints(id, records, start_date, end_date)
+        return records
+
+    @staticmethod
+    def is_hidden(id: int, start_date: datetime = None, end_date: datetime = None) -> bool:
+        """
+        Checks whether a profile's row is hidden over a range, for the few profiles
+        whose records jump at a known date.
+
+        Args:
+            id (int): The ID of the profile.
+            start_date (datetime, optional): The start date of the range.
+            end_date (datetime, optional): The end date of the range.
+
+        Returns:
+            bool: Whether the row should be treated as empty.
+        """
+        if id == 483515866319945728 and start_date < datetime(2024, 6, 2):
+            return end_date is None or datetime(2024, 6, 1) < end_date
+        elif id == 457989277322838016 and start_date < datetime(2025, 1, 20):
+            return end_date is None or datetime(2025, 1, 19) < end_date
+        elif id == 930180605612810310 and start_date < datetime(2025, 11, 30):
+            return end_date is None or datetime(2025, 11, 29) < end_date
+        return False
+
+    def get_endpoints(self, id: int,
+                      start_date: datetime = None, end_date: datetime = None,
+                      hold: bool = True) -> list[Record]:
+        """
+        Retrieves only the first and last records of a row, as get_row would give them.
+        Each end is a single lookup on the (id, timestamp) primary key rather than
+        a read of the whole range, and repeated calls on the same reader are cached.
+
+        Args:
+            id (int): The ID of the profile.
+            start_date (datetime, optional): The start date for filtering records.
+            end_date (datetime, optional): The end date for filtering records.
+            hold (bool, optional): Whether to extend the ends with held values. Defaults to True.
+
+        Returns:
+            list: The first and last records, a single record if there is only one, or an empty list.
+        """
+        key = (id, start_date, end_date, hold)
+        if key in self._endpoints:
+            return list(self._endpoints[key])
+        if self.is_hidden(id, start_date, end_date):
+            return []
+
+        record_query = self.session.query(Record).filter_by(id=id)
+        if start_date:
+            record_query = record_query.filter(Record.timestamp >= start_date)
+        if end_date:
+            record_query = record_query.filter(Record.timestamp <= end_date)
+
+        records = []
+        first = record_query.order_by(Record.timestamp).first()
+        if first is not None:
+            last = record_query.order_by(desc(Record.timestamp)).first()
+            records = [first] if last.timestamp == first.timestamp else [first, last]
+        if hold:
+            records = self.hold_endpoints(id, records, start_date, end_date)
+            # A held value may have been added in front of the first record
+            records = [records[0], records[-1]] if len(records) > 2 else records
+
+        self._endpoints[key] = records
+        return list(records)
+
+    def hold_endpoints(self, id: int, records: list[Record],
+                       start_date: datetime = None, end_date: datetime = None) -> list[Record]:
+        """
+        Extends a row to the edges of the range by holding the nearest values.
+        Records are only stored when the value changes, so a value is considered
+        held until the next record, as long as the gap is under RECORD_HOLD_LIMIT.
+        The end is held until the last collection.
+        The added records are not part of the session.
+
+        Args:
+            id (int): The ID of the profile.
+            records (list[Record]): The records within the range.
+            start_date (datetime, optional): The start date of the range.
+            end_date (datetime, optional): The end date of the range.
+
+        Returns:
+            list: The records with the held values added at either end.
+        """
+        limit = RECORD_HOLD_LIMIT
+
+        if start_date and (not records or records[0].timestamp > start_date):
+            previous = (self.session.query(Record)
+                        .filter_by(id=id)
+                        .filter(Record.timestamp < start_date)
+                        .order_by(desc(Record.timestamp))
+                        .first())
+            if previous is not None and start_date - previous.timestamp < limit:
+                records.insert(0, Record(id=id, timestamp=start_date, value=previous.value))
+
+        if records:
+            if self._last_collection is None:
+                self._last_collection = self.get_last_collection()
+            last_time = self._last_collection
+            if end_date and end_date < last_time:
+                last_time = end_date
+            if timedelta(0) < last_time - records[-1].timestamp < limit:
+                records.append(Record(id=id, timestamp=last_time, value=records[-1].value))
+        return records
 
     def get_data_in_range(self, start_date: datetime = None, end_date: datetime = None,
                           limit: int = 15, include: set[int] = None) -> list[tuple]:
@@ -208,6 +326,66 @@ class DatabaseReader(BaseDatabase):
 
         return result
 
+    def get_daily_values(self, start_date: datetime = None, end_date: datetime = None,
+                         include: set[int] = None) -> list[tuple[int, str, int]]:
+        """
+        Retrieves the value of every profile at the end of each day, in a single query.
+        Xp only grows, so the largest value of a day is its last.
+
+        Args:
+            start_date (datetime, optional): The start date for filtering records.
+            end_date (datetime, optional): The end date for filtering records.
+            include (set, optional): A list of profile IDs to include. Defaults to None.
+
+        Returns:
+            list: Tuples of the profile ID, the day as 'YYYY-MM-DD' and the value.
+        """
+        day = func.date(Record.timestamp)
+        query = self.session.query(Record.id, day, func.max(Record.value))
+        if start_date:
+            query = query.filter(Record.timestamp >= start_date)
+        if end_date:
+            query = query.filter(Record.timestamp <= end_date)
+        if include and hasattr(include, '__iter__'):
+            query = query.filter(Record.id.in_(include))
+        return query.group_by(Record.id, day).all()
+
+    def get_values_in_range(self, start_date: datetime = None, end_date: datetime = None,
+                            hold: bool = True) -> list[tuple[int, float, int]]:
+        """
+        Retrieves every record within a specified date range in a single query.
+        Times are read as Julian day numbers, which is much faster than building datetimes.
+        Hidden rows are not filtered out, as that is a check per profile.
+
+        Args:
+            start_date (datetime, optional): The start date for filtering records.
+            end_date (datetime, optional): The end date for filtering records.
+            hold (bool, optional): Whether to start each row with the value held from before
+                the range, as hold_endpoints does. Defaults to True.
+
+        Returns:
+            list: Tuples of the profile ID, Julian day and value, ordered by profile then time.
+        """
+        day = func.julianday(Record.timestamp)
+        query = self.session.query(Record.id, day.label('day'), Record.value)
+        if start_date:
+            query = query.filter(Record.timestamp >= start_date)
+        if end_date:
+            query = query.filter(Record.timestamp <= end_date)
+
+        if hold and start_date:
+            # The last record of each profile before the range, if it is still held
+            previous = (self.session.query(Record.id, func.max(Record.timestamp).label('timestamp'))
+                        .filter(Record.timestamp < start_date,
+                                Record.timestamp > start_date - RECORD_HOLD_LIMIT)
+                        .group_by(Record.id)
+                        .subquery())
+            held = (self.session.query(Record.id, func.julianday(start_date).label('day'), Record.value)
+                    .join(previous, (Record.id == previous.c.id)
+                          & (Record.timestamp == previous.c.timestamp)))
+            query = query.union_all(held)
+        return query.order_by(Record.id, 'day').all()
+
     def get_last_timestamp(self):
         """
         Retrieves the most recent timestamp from the records.
@@ -217,6 +395,33 @@ class DatabaseReader(BaseDatabase):
         """
         return self.session.query(func.max(Record.timestamp)).first()[0]
 
+    def get_last_collection(self) -> datetime | None:
+        """
+        Retrieves the time of the most recent collection. Records are only stored when the xp
+        changes, so this may be later than the last record.
+        Databases from before collections were stored fall back to the last record.
+
+        Returns:
+            datetime | None: The most recent collection time, or None if there are no records.
+        """
+        last = self.session.query(func.max(Collection.timestamp)).first()[0]
+        return last or self.get_last_timestamp()
+
+    def get_collection_times(self, start_date: datetime = None) -> list[datetime]:
+        """
+        Retrieves the times of the collections since a date.
+
+        Args:
+            start_date (datetime, optional): The start date for filtering collections.
+
+        Returns:
+            list: The collection times, oldest first.
+        """
+        query = self.session.query(Collection.timestamp)
+        if start_date:
+            query = query.filter(Collection.timestamp >= start_date)
+        return [i.timestamp for i in query.order_by(Collection.timestamp).all()]
+
     def get_last_record(self):
         """
         Retrieves the last record for each profile.
@@ -231,6 +436,91 @@ class DatabaseReader(BaseDatabase):
         # return [(i, i.records[-1]) for i in profile_query]
         return profile_query
 
+    def get_last_values(self) -> dict[int, tuple[datetime, int]]:
+        """
+        Retrieves the most recent record of every profile.
+
+        Returns:
+            dict: A mapping of profile ID to the timestamp and value of their last record.
+        """
+        latest = (self.session.query(Record.id, func.max(Record.timestamp).label('timestamp'))
+                  .group_by(Record.id)
+                  .subquery())
+        query = (self.session.query(Record.id, Record.timestamp, Record.value)
+                 .join(latest, (Record.id == latest.c.id)
+                       & (Record.timestamp == latest.c.timestamp)))
+        return {id: (timestamp, value) for id, timestamp, value in query}
+
+    def get_all_endpoints(self, start_date: datetime,
+                          end_date: datetime = None) -> dict[int, tuple[datetime, int, datetime, int]]:
+        """
+        Retrieves the first and last records of every profile within a range in a single query,
+        with the ends held as get_endpoints would hold them.
+
+        Args:
+            start_date (datetime): The start date of the range.
+            end_date (datetime, optional): The end date of the range.
+
+        Returns:
+            dict: A mapping of profile ID to the timestamp and value at each end of their row.
+        """
+        limit = RECORD_HOLD_LIMIT
+
+        # Each end is a lookup on the (id, timestamp) primary key for each profile,
+        # which is much faster than grouping every record in the range
+        def end_of_row(column, *conditions, order=Record.timestamp):
+            return (self.session.query(column)
+                    .filter(Record.id == Profile.id, *conditions)
+                    .order_by(order)
+                    .limit(1)
+                    .correlate(Profile)
+                    .scalar_subquery())
+
+        in_range = [Record.timestamp >= start_date]
+        if end_date:
+            in_range.append(Record.timestamp <= end_date)
+        # The last record before the range, in case it is held
+        before = [Record.timestamp < start_date]
+        latest = desc(Record.timestamp)
+        query = self.session.query(Profile.id,
+                                   end_of_row(Record.timestamp, *in_range),
+                                   end_of_row(Record.value, *in_range),
+                                   end_of_row(Record.timestamp, *in_range, order=latest),
+                                   end_of_row(Record.value, *in_range, order=latest),
+                                   end_of_row(Record.timestamp, *before, order=latest),
+                                   end_of_row(Record.value, *before, order=latest))
+
+        if self._last_collection is None:
+            self._last_collection = self.get_last_collection()
+        last_time = self._last_collection
+        if end_date and end_date < last_time:
+            last_time = end_date
+
+        result = {}
+        for id, first_time, first_value, final_time, final_value, held_time, held_value in query:
+            if first_time is None or self.is_hidden(id, start_date, end_date):
+                continue
+            if held_time is not None and first_time > start_date and start_date - held_time < limit:
+                first_time, first_value = start_date, held_value
+            if timedelta(0) < last_time - final_time < limit:
+                final_time = last_time
+            result[id] = (first_time, first_value, final_time, final_value)
+        return result
+
+    def get_profile_history(self, id: int) -> list[ProfileHistory]:
+        """
+        Retrieves the name and avatar changes of a profile.
+
+        Args:
+            id (int): The ID of the profile.
+
+        Returns:
+            list: The changes, oldest first.
+        """
+        return (self.session.query(ProfileHistory)
+                .filter_by(id=id)
+                .order_by(ProfileHistory.timestamp).all())
+
     def get_profile_data(self, id=None):
         """
         Retrieves profile data for a specific ID or all profiles if no ID is provided.
@@ -252,9 +542,10 @@ class DatabaseSaver(BaseDatabase):
     """
 
     def update_profile(self, id, name: str = None, colour: str = None, avatar: str = None,
-                       colours: list[str] = None) -> None:
+                       colours: list[str] = None, timestamp: datetime = None) -> None:
         """
         Updates or creates a profile in the database.
+        Changes to the name or avatar are also added to the profile history.
 
         Args:
             id (int): The ID of the profile.
@@ -262,15 +553,24 @@ class DatabaseSaver(BaseDatabase):
             colour (str, optional): The colour of the profile. Defaults to None.
             avatar (str, optional): The avatar of the profile. Defaults to None.
             colours (list[str], optional): A list of colours of the profile. Defaults to None.
+            timestamp (datetime, optional): When the change was seen. Defaults to now.
         """
         profile = self.session.query(Profile).filter_by(id=id).first()
+        timestamp = timestamp or datetime.now()
 
         if profile is None:
             new_profile = Profile(id=id, name=name,
-                                  colour=colour, avatar=avatar)
+                                  colour=colour, avatar=avatar,
+                                  colours=','.join(colours) if colours else None)
             self.session.add(new_profile)
+            self.session.add(ProfileHistory(id=id, timestamp=timestamp, name=name, avatar=avatar))
             return
 
+        if (name and name != profile.name) or (avatar and avatar != profile.avatar):
+            self.session.add(ProfileHistory(id=id, timestamp=timestamp,
+                                            name=name or profile.name,
+                                            avatar=avatar or profile.avatar))
+
         profile.name = name or profile.name
         profile.colour = colour or profile.colour
         profile.avatar = avatar or profile.avatar
@@ -293,6 +593,16 @@ class DatabaseSaver(BaseDatabase):
         new_record = Record(id=id, timestamp=timestamp, value=value)
         self.session.add(new_record)
 
+    def insert_collection(self, timestamp: datetime) -> None:
+        """
+        Notes that a collection took place, even if no records were stored.
+        Saving the same collection again has no effect.
+
+        Args:
+            timestamp (datetime): The time of the collection.
+        """
+        self.session.merge(Collection(timestamp=timestamp))
+
     def load_from_csv(self, data):
         """
         Loads data from a CSV file into the database.
@@ -373,13 +683,11 @@ if __name__ == '__main__':
     #
     from gwaff.predictor import xp_to_lvl
     import json
+    import numpy as np
 
-    levels = {}
-    for i in dbr.get_last_record():
-        if i[1] <= 12017:
-            continue
-        # print(f'    "{i[0].id}": {xp_to_lvl(i[1])},')
-        levels[str(i[0].id)] = xp_to_lvl(i[1])
+    records = dbr.get_last_record()
+    levels = xp_to_lvl(np.array([value for _, value in records])).tolist()
+    levels = {str(profile.id): level for (profile, _), level in zip(records, levels)}
     json.dump(levels, open(os.path.join(BASE_DIR, 'levels.json'), 'w'))
     print(str(levels).replace("'", '"'))
 
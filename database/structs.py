@@ -58,6 +58,29 @@ Profile.records = relationship(
     'Record', order_by=Record.timestamp, back_populates='profile')
 
 
+class ProfileHistory(Base):
+    """
+    Represents a change to a profile's name or avatar. Rows are only ever appended.
+
+    Attributes:
+        row (int): The primary key of the change.
+        id (int): The ID of the profile that changed.
+        timestamp (datetime): When the change was seen.
+        name (str): The name of the profile after the change.
+        avatar (str): The avatar URL of the profile after the change.
+    """
+    __tablename__ = 'profile_history'
+
+    row = Column(Integer, primary_key=True, autoincrement=True)
+    id = Column(Integer, ForeignKey('profiles.id'), nullable=False, index=True)
+    timestamp = Column(DateTime, nullable=False)
+    name = Column(String)
+    avatar = Column(String)
+
+    def __repr__(self):
+        return f'<ProfileHistory {self.id}, {self.timestamp}, {self.name}>'
+
+
 class MinecraftUser(Base):
     """
     Represents a Minecraft user associated with a Discord profile in the database.
@@ -96,3 +119,18 @@ class Event(Base):
 
     def __repr__(self):
         return f'<Event {self.id}, {self.start_time}, {self.end_time}, {self.multiplier}>'
+
+
+class Collection(Base):
+    """
+    Represents a collection of the leaderboard, whether or not any records were stored.
+
+    Attributes:
+        timestamp (datetime): The time of the collection.
+    """
+    __tablename__ = 'collections'
+
+    timestamp = Column(DateTime, primary_key=True)
+
+    def __repr__(self):
+        return f'<Collection {self.timestamp}>'
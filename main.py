@@ -17,15 +17,17 @@ filterwarnings("ignore", category=UserWarning, module="matplotlib\..*", lineno=0
 
 logger.info("Filtering warnings")
 
-dbc = DatabaseCreator()
-dbc.create_database()
+if __name__ == '__main__':
+    # Render workers are spawned and import this module again, so they must not start the bot
+    dbc = DatabaseCreator()
+    dbc.create_database()
 
-from gwaff.bot import run_the_bot
+    from gwaff.bot import run_the_bot
 
-# Retrieve the bot token from environment variables
-TOKEN = os.environ.get('BOT_TOKEN')
+    # Retrieve the bot token from environment variables
+    TOKEN = os.environ.get('BOT_TOKEN')
 
-# Run the bot using the retrieved token
-asyncio.run(run_the_bot(TOKEN))
+    # Run the bot using the retrieved token
+    asyncio.run(run_the_bot(TOKEN))
 
-logger.info("Fin!")
+    logger.info("Fin!")
@@ -0,0 +1,127 @@
+import os
+from collections import deque
+from datetime import datetime
+from math import ceil
+from threading import Lock
+from typing import Any
+
+METRICS_HISTORY: int = int(os.environ.get("METRICS_HISTORY", 200))  # Samples to keep per history
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+
+
+class MetricsHistory:
+    """
+    A rolling history of metric samples.
+    Each sample is a dictionary of metric names to numbers, or lists of numbers.
+
+    Attributes:
+        samples (deque): The most recent samples, oldest first.
+    """
+
+    def __init__(self, size: int = METRICS_HISTORY):
+        """
+        Initialises the history.
+
+        Args:
+            size (int, optional): The number of samples to keep. Defaults to METRICS_HISTORY.
+        """
+        self.samples: deque[dict[str, Any]] = deque(maxlen=size)
+        self.lock = Lock()
+
+    def add(self, sample: dict[str, Any]) -> None:
+        """
+        Adds a sample to the history, timestamping it if it has no time.
+
+        Args:
+            sample (dict): The sample to add.
+        """
+        sample.setdefault('time', datetime.now())
+        with self.lock:
+            self.samples.append(sample)
+
+    def series(self, key: str) -> list[float]:
+        """
+        Gets the values of a metric across the history. Metrics with several values per
+        sample are summarised by their mean.
+
+        Args:
+            key (str): The name of the metric.
+
+        Returns:
+            list: The value of the metric in each sample that has it.
+        """
+        with self.lock:
+            values = [sample[key] for sample in self.samples if key in sample]
+        return [(sum(value) / len(value) if value else 0) if isinstance(value, list) else value
+                for value in values]
+
+    def values(self, key: str) -> list[float]:
+        """
+        Gets every individual value of a metric across the history.
+
+        Args:
+            key (str): The name of the metric.
+
+        Returns:
+            list: Every value of the metric, flattened across samples.
+        """
+        with self.lock:
+            values = [sample[key] for sample in self.samples if key in sample]
+        flat = []
+        for value in values:
+            if isinstance(value, list):
+                flat.extend(value)
+            else:
+                flat.append(value)
+        return flat
+
+    def summary(self, key: str, percents: tuple[int, ...] = (50, 90, 99)) -> dict[int, float]:
+        """
+        Finds percentiles of every individual value of a metric.
+
+        Args:
+            key (str): The name of the metric.
+            percents (tuple, optional): The percentiles to find. Defaults to (50, 90, 99).
+
+        Returns:
+            dict: A mapping of percent to value, empty if there are no values.
+        """
+        values = self.values(key)
+        return {p: percentile(values, p) for p in percents} if values else {}
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """
+    Finds the nearest-rank percentile of some values.
+
+    Args:
+        values (list): The values.
+        percent (float): The percentile, from 0 to 100.
+
+    Returns:
+        float: The value at the percentile.
+    """
+    ordered = sorted(values)
+    index = max(ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def sparkline(values: list[float], width: int = 30) -> str:
+    """
+    Draws a small text graph of some values.
+
+    Args:
+        values (list): The values, oldest first.
+        width (int, optional): The maximum number of values to show, keeping the latest. Defaults to 30.
+
+    Returns:
+        str: The graph.
+    """
+    values = values[-width:]
+    if not values:
+        return ''
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARK_CHARS[0] * len(values)
+    scale = (len(SPARK_CHARS) - 1) / (high - low)
+    return ''.join(SPARK_CHARS[round((value - low) * scale)] for value in values)
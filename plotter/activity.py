@@ -0,0 +1,145 @@
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.colors import LinearSegmentedColormap, PowerNorm
+from matplotlib.dates import AutoDateLocator, date2num
+from matplotlib.figure import Figure
+
+from gwaff.database.db_base import DatabaseReader
+from gwaff.plotter.plotter import Colours, FigureTemplate, Plotter, GRAPH_DEFAULT_USERS
+
+ACTIVITY_SIZE = (15, 3.4)
+WEEKDAY_LABELS = {6.5: 'Mon', 4.5: 'Wed', 2.5: 'Fri'}  # Row centres, with Monday at the top
+
+
+def daily_gains(rows: list[tuple[int, str, int]], first: date, days: int) -> np.ndarray:
+    """
+    Finds the xp each profile gained on each day, from their values at the end of each day.
+    Days without records hold the previous value, and the day a profile first appears
+    counts as no gain.
+
+    Args:
+        rows (list): The profile ID, day and value of each day, as from DatabaseReader.get_daily_values.
+            Should include the day before first, to find the gain on the first day.
+        first (date): The first day.
+        days (int): The number of days.
+
+    Returns:
+        np.ndarray: The gains, with a row for each profile and a column for each day.
+    """
+    ids, day_strings, values = zip(*rows)
+    # Column 0 is the day before the first day
+    columns = (np.array(day_strings, dtype='datetime64[D]')
+               - np.datetime64(first - timedelta(days=1))).astype(int)
+    _, profile_rows = np.unique(ids, return_inverse=True)
+
+    grid = np.full((profile_rows.max() + 1, days + 1), np.nan)
+    keep = (columns >= 0) & (columns <= days)
+    grid[profile_rows[keep], columns[keep]] = np.asarray(values, dtype=float)[keep]
+
+    # Fill each gap with the last known value
+    known = np.where(np.isnan(grid), 0, np.arange(days + 1))
+    np.maximum.accumulate(known, axis=1, out=known)
+    grid = np.take_along_axis(grid, known, axis=1)
+
+    return np.clip(np.nan_to_num(np.diff(grid, axis=1)), 0, None)
+
+
+class Activity(Plotter):
+    """
+    A calendar of daily xp gain like a GitHub contribution graph, with a column for each week
+    and a row for each weekday. Shows one member, or everyone added together.
+    The days are drawn as a single mesh, so a year costs no more than a week.
+
+    Attributes:
+        total (int): The xp gained over the whole calendar.
+        best (int): The most xp gained in a day.
+        edges (np.ndarray | None): The start of each week and the end of the last, as date numbers.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('title', "Server activity")
+        super().__init__(*args, **kwargs)
+        self.total = 0
+        self.best = 0
+        self.edges: np.ndarray | None = None
+
+    def get_figure(self) -> tuple[Figure, Axes]:
+        """
+        Builds a figure of its own, as the calendar is much wider than it is tall.
+
+        Returns:
+            tuple: The figure and axes.
+        """
+        template = FigureTemplate(figsize=ACTIVITY_SIZE)
+        template.fig.subplots_adjust(left=0.04, bottom=0.22, top=0.86, right=0.98)
+        template.ax.grid(False)
+        template.ax.tick_params(left=False)
+        return template.fig, template.ax
+
+    def get_daily_data(self, start_date: datetime, include: set[int] = None) -> list[tuple]:
+        dbr = DatabaseReader()
+        return dbr.get_daily_values(start_date, self.end_date, include=include)
+
+    def draw(self, limit: int = GRAPH_DEFAULT_USERS, include: set[int] = None,
+             colour: str = Colours.text) -> None:
+        """
+        Draws the calendar.
+
+        Args:
+            limit (int, optional): Not used, as every member is counted.
+            include (set[int], optional): If specified, only counts the specified user IDs. Defaults to None.
+            colour (str, optional): The colour of the busiest days. Defaults to Colours.text.
+
+        Throws:
+            IndexError: If there are no records in the range.
+        """
+        start = self.start_date.date()
+        end = (self.end_date or datetime.now()).date()
+        # The calendar starts on the Monday of the first week
+        first = start - timedelta(days=start.weekday())
+        days = (end - first).days + 1
+        weeks = -(-days // 7)
+
+        rows = self.get_daily_data(datetime.combine(first - timedelta(days=1), time()), include)
+        if not rows:
+            raise IndexError("No records to plot")
+        daily = daily_gains(rows, first, days).sum(axis=0)
+        daily[:(start - first).days] = 0
+        self.total, self.best = int(daily.sum()), int(daily.max())
+
+        cells = np.full(weeks * 7, np.nan)
+        cells[(start - first).days:days] = daily[(start - first).days:]
+        # A column per week, with Monday in the top row
+        cells = np.ma.masked_invalid(cells.reshape(weeks, 7).T[::-1])
+
+        self.edges = date2num(np.datetime64(first) + np.arange(weeks + 1) * 7)
+        cmap = LinearSegmentedColormap.from_list('activity', [Colours.highlight, colour])
+        cmap.set_bad(alpha=0)
+        self.ax.pcolormesh(self.edges, np.arange(8), cells, cmap=cmap,
+                           norm=PowerNorm(0.5, vmin=0, vmax=max(self.best, 1)),
+                           edgecolors=Colours.inside, linewidth=2)
+
+    def configure(self) -> None:
+        """
+        Configures the plot, keeping the days square.
+        """
+        super().configure()
+        self.ax.set_xlim(self.edges[0], self.edges[-1])
+        # About one date every three weeks, so they fit under the narrow columns
+        self.ax.xaxis.set_major_locator(AutoDateLocator(maxticks=max(len(self.edges) // 3, 2)))
+        self.ax.set_ylim(0, 7)
+        self.ax.set_aspect(7)  # A week is 7 units wide and a weekday 1 tall
+        self.ax.set_yticks(list(WEEKDAY_LABELS), list(WEEKDAY_LABELS.values()))
+        self.ax.set_ylabel('')
+        self.ax.set_xlabel(f"{self.total:,} XP gained, at most {self.best:,} in a day", color=Colours.text)
+
+
+if __name__ == '__main__':
+    plot = Activity(start_date=datetime.now() - timedelta(days=365))
+    plot.draw()
+    plot.configure()
+
+    plot.save('activity.png')
+    plot.close()
@@ -0,0 +1,263 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from io import BytesIO
+from threading import Lock
+
+import numpy as np
+from PIL import Image
+
+from gwaff.custom_logger import Logger
+from gwaff.database.db_base import DatabaseReader
+from gwaff.utils import request_img
+
+logger = Logger('gwaff.plotter.avatars')
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AVATAR_DIR = os.path.join(BASE_DIR, 'generated', 'avatars')
+
+AVATAR_ZOOM: float = 0.1  # Zoom of a full size avatar on the graph
+AVATAR_MEMORY_ITEMS: int = int(os.environ.get("AVATAR_MEMORY_ITEMS", 256))
+AVATAR_DISK_MAX_MB: int = int(os.environ.get("AVATAR_DISK_MAX_MB", 64))
+AVATAR_TTL_HOURS: int = int(os.environ.get("AVATAR_TTL_HOURS", 24 * 7))
+AVATAR_FAILURE_TTL: int = 10 * 60  # Seconds to wait before retrying an avatar that failed to download
+AVATAR_FETCH_WORKERS: int = int(os.environ.get("AVATAR_FETCH_WORKERS", 8))
+AVATAR_DEADLINE: float = float(os.environ.get("AVATAR_DEADLINE", 10))  # Seconds to wait for avatars per plot
+AVATAR_PREWARM_COUNT: int = int(os.environ.get("GRAPH_MAX_USERS", 30))
+AVATAR_EVICT_EVERY: int = 32  # Avatars written to disk between checks of its size
+GRAPH_DEFAULT_DAYS: int = int(os.environ.get("GRAPH_DEFAULT_DAYS", 7))
+
+
+class AvatarCache:
+    """
+    A two-level cache of avatar images.
+    Decoded images, scaled down to the size they are drawn at, are kept in an in-memory LRU.
+    The downloaded files are kept on disk keyed by a hash of their URL, so they survive restarts
+    and are shared by every render worker. Each process has its own memory cache.
+
+    Attributes:
+        directory (str): The directory of the disk cache.
+        memory (OrderedDict): The decoded images and their zoom by URL, least recently used first.
+        failures (dict): The time each URL last failed to download.
+        writes (int): Avatars written to disk since its size was last checked.
+    """
+
+    def __init__(self, directory: str = AVATAR_DIR,
+                 memory_items: int = AVATAR_MEMORY_ITEMS,
+                 disk_max_mb: int = AVATAR_DISK_MAX_MB,
+                 ttl_hours: int = AVATAR_TTL_HOURS):
+        """
+        Initialises the cache.
+
+        Args:
+            directory (str, optional): The directory of the disk cache. Defaults to AVATAR_DIR.
+            memory_items (int, optional): The number of images to keep in memory. Defaults to AVATAR_MEMORY_ITEMS.
+            disk_max_mb (int, optional): The maximum size of the disk cache. Defaults to AVATAR_DISK_MAX_MB.
+            ttl_hours (int, optional): How long an avatar is kept before downloading it again.
+                Defaults to AVATAR_TTL_HOURS.
+        """
+        self.directory = directory
+        self.memory_items = memory_items
+        self.disk_max_bytes = disk_max_mb * 1024 * 1024
+        self.ttl = ttl_hours * 60 * 60
+        self.memory: OrderedDict[str, tuple[np.ndarray, float, float]] = OrderedDict()
+        self.failures: dict[str, float] = {}
+        # Check the size on the first write, as other processes may have filled the disk cache
+        self.writes = AVATAR_EVICT_EVERY
+        self.lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=AVATAR_FETCH_WORKERS,
+                                           thread_name_prefix='avatar')
+
+    def path(self, url: str) -> str:
+        """
+        Finds where an avatar is stored on disk.
+
+        Args:
+            url (str): The avatar URL.
+
+        Returns:
+            str: The path of the file.
+        """
+        return os.path.join(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def get(self, url: str) -> tuple[np.ndarray, float] | None:
+        """
+        Gets an avatar, from memory, disk, or by downloading it.
+
+        Args:
+            url (str): The avatar URL.
+
+        Returns:
+            tuple: The image as an array and the zoom to draw it at, or None on failure.
+        """
+        if not url:
+            return None
+        now = time.time()
+
+        with self.lock:
+            cached = self.memory.get(url)
+            if cached is not None and now - cached[2] < self.ttl:
+                self.memory.move_to_end(url)
+                return cached[0], cached[1]
+            if now - self.failures.get(url, 0) < AVATAR_FAILURE_TTL:
+                return None
+
+        data, loaded = self.read_disk(url, now)
+        if data is None:
+            image = request_img(url)
+            if image is None:
+                with self.lock:
+                    self.failures[url] = now
+                return None
+            data, loaded = image.getvalue(), now
+            self.write_disk(url, data)
+
+        try:
+            array, zoom = self.decode(data)
+        except Exception as e:
+            logger.warning(f"Failed to decode avatar: {str(e)}")
+            with self.lock:
+                self.failures[url] = now
+            return None
+
+        with self.lock:
+            self.memory[url] = (array, zoom, loaded)
+            self.memory.move_to_end(url)
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+        return array, zoom
+
+    def get_many(self, urls: list[str],
+                 deadline: float | None = AVATAR_DEADLINE) -> dict[str, tuple[np.ndarray, float]]:
+        """
+        Gets several avatars at once, downloading the missing ones concurrently.
+        Avatars that are not ready by the deadline are left out, but keep downloading
+        in the background so they are cached for next time.
+
+        Args:
+            urls (list[str]): The avatar URLs.
+            deadline (float, optional): The seconds to wait in total, or None to wait for every avatar.
+                Defaults to AVATAR_DEADLINE.
+
+        Returns:
+            dict: The avatars that were ready, as (image, zoom) by URL.
+        """
+        futures = {url: self.executor.submit(self.get, url) for url in set(urls) if url}
+        done, not_done = wait(futures.values(), timeout=deadline)
+        if not_done:
+            logger.warning(f"{len(not_done)} avatars were not ready in time")
+
+        result = {}
+        for url, future in futures.items():
+            if future in done and future.exception() is None and future.result() is not None:
+                result[url] = future.result()
+        return result
+
+    @staticmethod
+    def decode(data: bytes) -> tuple[np.ndarray, float]:
+        """
+        Decodes an image and scales it down to the size it is drawn at.
+
+        Args:
+            data (bytes): The image file.
+
+        Returns:
+            tuple: The image as an RGBA array and the zoom to draw it at.
+        """
+        with Image.open(BytesIO(data)) as image:
+            image = image.convert('RGBA')
+            width, height = image.size
+            target = max(round(width * AVATAR_ZOOM), 1)
+            if target < width:
+                image = image.resize((target, max(round(height * target / width), 1)),
+                                     Image.Resampling.LANCZOS)
+            return np.asarray(image), AVATAR_ZOOM * width / image.size[0]
+
+    def read_disk(self, url: str, now: float) -> tuple[bytes | None, float]:
+        """
+        Reads an avatar from the disk cache if it has not expired.
+
+        Args:
+            url (str): The avatar URL.
+            now (float): The current time.
+
+        Returns:
+            tuple: The image file, or None if it is missing or expired, and when it was downloaded.
+        """
+        path = self.path(url)
+        try:
+            modified = os.path.getmtime(path)
+            if now - modified >= self.ttl:
+                return None, now
+            with open(path, 'rb') as file:
+                return file.read(), modified
+        except OSError:
+            return None, now
+
+    def write_disk(self, url: str, data: bytes) -> None:
+        """
+        Writes an avatar to the disk cache. Every AVATAR_EVICT_EVERY writes, the oldest avatars
+        are evicted if it is too large, so it may briefly go over its limit.
+
+        Args:
+            url (str): The avatar URL.
+            data (bytes): The image file.
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Render workers may write the same avatar at once
+            temp_path = f'{self.path(url)}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, self.path(url))
+            with self.lock:
+                self.writes += 1
+                evict = self.writes >= AVATAR_EVICT_EVERY
+                if evict:
+                    self.writes = 0
+            if evict:
+                self.evict_disk()
+        except OSError as e:
+            logger.warning(f"Failed to cache avatar: {str(e)}")
+
+    def evict_disk(self) -> None:
+        """
+        Removes the oldest avatars until the disk cache is within its size limit.
+        """
+        entries = []
+        with os.scandir(self.directory) as files:
+            for entry in files:
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def prewarm(self, count: int = AVATAR_PREWARM_COUNT, deadline: float | None = None) -> int:
+        """
+        Loads the avatars of the current top chatters into the cache of this process,
+        and onto the disk for the others.
+
+        Args:
+            count (int, optional): The number of top chatters. Defaults to AVATAR_PREWARM_COUNT.
+            deadline (float, optional): The seconds to wait, or None to wait for every avatar.
+                Defaults to None.
+
+        Returns:
+            int: The number of avatars loaded.
+        """
+        start_date = datetime.now() - timedelta(days=GRAPH_DEFAULT_DAYS)
+        urls = [profile[3] for profile, _, _ in DatabaseReader().get_growth_in_range(start_date, limit=count)]
+        loaded = len(self.get_many(urls, deadline=deadline))
+        logger.info(f"Prewarmed {loaded} avatars")
+        return loaded
+
+
+avatar_cache = AvatarCache()
@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.colors import LinearSegmentedColormap, LogNorm
+from matplotlib.dates import date2num, julian2num
+
+from gwaff.custom_logger import Logger
+from gwaff.database.db_base import DatabaseReader
+from gwaff.plotter.growth import Growth
+from gwaff.plotter.plotter import Colours, GRAPH_DEFAULT_USERS, colour_cycle
+
+logger = Logger('gwaff.plotter.density')
+
+
+def rasterise(lines: list[tuple[np.ndarray, np.ndarray]], width: int, height: int) -> np.ndarray:
+    """
+    Counts how many lines cross each pixel, like the line aggregation of datashader.
+    Every line is sampled at the edges of each pixel column and covers the rows between
+    neighbouring samples, so steep lines stay connected. The work grows with the number of
+    lines and columns, not with the number of points.
+
+    Args:
+        lines (list): The xs, in columns from 0 to width, and ys, in rows from 0 to height, of each line.
+        width (int): The number of columns.
+        height (int): The number of rows.
+
+    Returns:
+        np.ndarray: The number of lines in each pixel, with row 0 at the bottom.
+    """
+    edges = np.arange(width + 1)
+    sampled = np.empty((len(lines), width + 1))
+    for row, (xs, ys) in zip(sampled, lines):
+        # Nothing before a line starts, and its last value is held after it ends
+        row[:] = np.interp(edges, xs, ys, left=np.nan)
+
+    low = np.fmin(sampled[:, :-1], sampled[:, 1:])
+    high = np.fmax(sampled[:, :-1], sampled[:, 1:])
+    drawn = ~np.isnan(low)
+    columns = np.broadcast_to(np.arange(width), drawn.shape)[drawn]
+    low = np.clip(low[drawn], 0, height - 1).astype(int)
+    high = np.clip(high[drawn], 0, height - 1).astype(int)
+
+    # Mark where each span starts and stops, then add the marks up each column
+    size = (height + 1) * width
+    marks = (np.bincount(low * width + columns, minlength=size)
+             - np.bincount((high + 1) * width + columns, minlength=size))
+    return np.cumsum(marks.reshape(height + 1, width), axis=0)[:-1]
+
+
+class Density(Growth):
+    """
+    A growth plot of every member who gained xp, however many there are.
+    The lines are counted into a grid with a cell per pixel of the axes and shown as one image,
+    so the time taken depends on the size of the plot rather than the number of lines.
+    Only the top members are drawn as lines and labelled.
+    """
+
+    def get_values(self) -> list[tuple[int, float, int]]:
+        dbr = DatabaseReader()
+        return dbr.get_values_in_range(self.start_date, self.end_date)
+
+    def draw(self, limit: int = GRAPH_DEFAULT_USERS, include: set[int] = None) -> None:
+        """
+        Draws the density of every member who gained xp, and the lines of the top members.
+
+        Args:
+            limit (int, optional): The number of top members to draw and label. Defaults to GRAPH_DEFAULT_USERS.
+            include (set[int], optional): Not used, as every member is drawn.
+
+        Throws:
+            IndexError: If nobody gained xp in the range.
+        """
+        rows = self.get_values()
+        if not rows:
+            raise IndexError("No members to plot")
+        ids, days, values = (np.array(column) for column in zip(*rows))
+
+        # The records of each member are together, in time order, starting from the held value
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ends = np.r_[starts[1:], len(ids)]
+        series = np.repeat(np.arange(len(starts)), ends - starts)
+        growth = values - values[starts][series]
+        final = growth[ends - 1]
+        shown = np.array([not DatabaseReader.is_hidden(int(ids[start]), self.start_date, self.end_date)
+                          for start in starts])
+        active = (final > 0) & shown
+        if not active.any():
+            raise IndexError("No members to plot")
+
+        x_min = date2num(self.start_date)
+        x_max = date2num(self.end_date or datetime.now())
+        top = final.max() * 1.05
+        xs = julian2num(days)
+
+        bbox = self.ax.get_window_extent()
+        width, height = int(bbox.width), int(bbox.height)
+        columns = (xs - x_min) / (x_max - x_min) * width
+        rows = growth / top * height
+        grid = rasterise([(columns[start:end], rows[start:end])
+                          for start, end in zip(starts[active], ends[active])],
+                         width, height)
+        logger.info(f"{active.sum()} members in the density")
+
+        cmap = LinearSegmentedColormap.from_list('density', [Colours.highlight, Colours.text])
+        cmap.set_bad(alpha=0)
+        self.ax.imshow(np.ma.masked_equal(grid, 0), extent=(x_min, x_max, 0, top), origin='lower',
+                       aspect='auto', interpolation='nearest', cmap=cmap,
+                       norm=LogNorm(vmin=1, vmax=max(grid.max(), 1)))
+
+        # The top members are drawn over the density as in Plotter.draw
+        profiles = {profile.id: profile for profile in DatabaseReader().get_profile_data()}
+        lines = []
+        colours = []
+        fallback = colour_cycle()
+        for index in np.argsort(final, kind='stable')[::-1][:limit]:
+            if not active[index]:
+                break
+            start, end = starts[index], ends[index]
+            lines.append(np.column_stack((xs[start:end], growth[start:end])))
+            profile = profiles.get(int(ids[start]))
+            if profile is None:
+                # A member without a profile is drawn but left unlabelled
+                colours.append(Colours.missing)
+                continue
+            colour = profile.colour or next(fallback)
+            self.annotations.append((final[index], profile.name, colour, profile.avatar, 0))
+            colours.append(colour)
+        self.ax.add_collection(LineCollection(lines, colors=colours))
+
+
+if __name__ == '__main__':
+    plot = Density(start_date=datetime.now() - timedelta(days=7), title="Everyone's XP growth")
+    plot.draw()
+    plot.draw_events()
+    plot.annotate()
+    plot.configure()
+
+    plot.save('density.png')
+    plot.close()
@@ -1,15 +1,25 @@
 import os.path
+import threading
+from collections.abc import Iterator
 from datetime import datetime, timedelta
-
-import matplotlib.pyplot as plt
-from matplotlib.dates import DateFormatter
+from io import BytesIO
+from itertools import cycle
+
+import matplotlib
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.dates import DateFormatter, date2num
+from matplotlib.axes import Axes
+from matplotlib.figure import Figure
 from matplotlib.font_manager import fontManager, FontProperties
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+from PIL import Image
 
 from gwaff.custom_logger import Logger
 from gwaff.database.db_base import DatabaseReader
 from gwaff.database.db_events import DatabaseEvents
-from gwaff.utils import request_img
+from gwaff.plotter.avatars import avatar_cache
 
 logger = Logger('gwaff.plotter')
 
@@ -25,8 +35,8 @@ e_font = FontProperties(fname=EMOJI_FONT_PATH)
 fonts = [FontProperties(fname=PRIMARY_FONT_PATH).get_name(),
          FontProperties(fname=EMOJI_FONT_PATH).get_name()]
 
-plt.rcParams['font.family'] = 'sans-serif'
-plt.rcParams['font.sans-serif'] = fonts + plt.rcParams['font.sans-serif']
+matplotlib.rcParams['font.family'] = 'sans-serif'
+matplotlib.rcParams['font.sans-serif'] = fonts + matplotlib.rcParams['font.sans-serif']
 
 WINDOW_SIZE = (15, 7)
 GRAPH_DEFAULT_USERS = int(os.environ.get("GRAPH_DEFAULT_USERS", 15))
@@ -34,6 +44,10 @@ GRAPH_SEPERATOR = 0.03
 GRAPH_IMAGE_WIDTH = 0.018
 RANK_DEFAULT_THRESHOLD = int(os.environ.get("RANK_DEFAULT_THRESHOLD", 30))
 
+PLOT_FORMAT: str = os.environ.get("PLOT_FORMAT", "png").lower()  # png or webp
+PLOT_PALETTE_COLOURS: int = int(os.environ.get("PLOT_PALETTE_COLOURS", 256))  # 0 to keep full colour
+PLOT_COMPRESS_LEVEL: int = int(os.environ.get("PLOT_COMPRESS_LEVEL", 6))  # zlib level for png
+
 
 class Colours:
     """
@@ -97,6 +111,145 @@ class ResponsiveDateFormat:
             return 'YYYY-MM'
 
 
+def encode(image: Image.Image, format: str = PLOT_FORMAT, colours: int = PLOT_PALETTE_COLOURS,
+           compress_level: int = PLOT_COMPRESS_LEVEL) -> bytes:
+    """
+    Encodes a plot image.
+    The flat dark theme needs few colours, so a palette shrinks the image a lot
+    without visible change.
+
+    Args:
+        image (Image.Image): The RGB image.
+        format (str, optional): 'png' or 'webp'. Defaults to PLOT_FORMAT.
+        colours (int, optional): The size of the palette to reduce to, or 0 to keep full colour.
+            Defaults to PLOT_PALETTE_COLOURS.
+        compress_level (int, optional): The png compression level, from 0 to 9.
+            Defaults to PLOT_COMPRESS_LEVEL.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    buffer = BytesIO()
+    if format == 'webp':
+        image.save(buffer, format='WEBP', lossless=True, method=4)
+    else:
+        if colours:
+            image = image.quantize(colours, method=Image.Quantize.FASTOCTREE,
+                                   dither=Image.Dither.NONE)
+        image.save(buffer, format='PNG', compress_level=compress_level)
+    return buffer.getvalue()
+
+
+def colour_cycle() -> Iterator[str]:
+    """
+    Gives matplotlib's default line colours in turn, for members without a colour of their own,
+    so that they can still be told apart.
+
+    Returns:
+        Iterator[str]: The colours, repeating forever.
+    """
+    return cycle(matplotlib.rcParams['axes.prop_cycle'].by_key()['color'])
+
+
+def separate_labels(heights: np.ndarray, low: float, high: float) -> np.ndarray:
+    """
+    Moves labels up so they are separated by at least GRAPH_SEPERATOR.
+    Each label defaults to next to its line, and moves up to avoid the labels below.
+    Label i is at least i separators above the first, so shifting every height down
+    by its index turns the pushes up into a running maximum.
+
+    Args:
+        heights (np.ndarray): The heights of the lines, in ascending order.
+        low (float): The height at the bottom of the axes.
+        high (float): The height at the top of the axes.
+
+    Returns:
+        np.ndarray: The heights of the labels.
+    """
+    span = (high - low) or 1
+    steps = np.arange(len(heights)) * GRAPH_SEPERATOR
+    shifted = (heights - low) / span - steps
+    return (np.maximum.accumulate(np.maximum(shifted, 0)) + steps) * span + low
+
+
+class FigureTemplate:
+    """
+    A figure with the static chrome of every plot already applied: colours, spines,
+    grid and layout. Each thread keeps one and reuses it for every plot, removing the
+    previous plot's data artists, so the figure, axes and tick artists are only built once.
+
+    Attributes:
+        fig (Figure): The matplotlib figure object.
+        ax (Axes): The matplotlib axes object.
+        in_use (bool): Whether a plot is currently drawing on the figure.
+    """
+    _local = threading.local()
+
+    def __init__(self, figsize: tuple[float, float] = WINDOW_SIZE):
+        """
+        Builds the figure and applies the static chrome.
+
+        Args:
+            figsize (tuple, optional): The size of the figure in inches. Defaults to WINDOW_SIZE.
+        """
+        self.fig = Figure(figsize=figsize)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.in_use = False
+
+        self.fig.patch.set_facecolor(Colours.outside)
+        self.ax.set_facecolor(Colours.inside)
+        self.ax.tick_params(colors=Colours.text)
+        for spine in self.ax.spines.values():
+            spine.set_visible(False)
+        self.ax.grid(visible=True, axis='y', color=Colours.outside)
+        self.ax.xaxis_date()
+        self.fig.subplots_adjust(left=0.06, bottom=0.08, top=0.94, right=0.83)
+
+    @classmethod
+    def acquire(cls) -> tuple[Figure, Axes]:
+        """
+        Gets this thread's template figure, cleared of any previous plot.
+        If it is already in use, a new template is built for the caller instead.
+
+        Returns:
+            tuple: The figure and axes.
+        """
+        template = getattr(cls._local, 'template', None)
+        if template is None or template.in_use:
+            template = cls()
+            if getattr(cls._local, 'template', None) is None:
+                cls._local.template = template
+        template.reset()
+        template.in_use = True
+        return template.fig, template.ax
+
+    @classmethod
+    def release(cls, fig: Figure) -> None:
+        """
+        Returns a figure from acquire so it can be reused.
+
+        Args:
+            fig (Figure): The figure.
+        """
+        template = getattr(cls._local, 'template', None)
+        if template is not None and template.fig is fig:
+            template.in_use = False
+
+    def reset(self) -> None:
+        """
+        Removes the data artists and text of the previous plot, keeping the chrome.
+        """
+        ax = self.ax
+        for artist in [*ax.lines, *ax.collections, *ax.patches, *ax.texts, *ax.artists, *ax.images]:
+            artist.remove()
+        ax.set_title('')
+        ax.set_xlabel('')
+        ax.set_ylabel('')
+        ax.relim()
+        ax.set_autoscale_on(True)
+
+
 class Plotter:
     """
     A class to create and manage plots of XP data over time.
@@ -128,7 +281,8 @@ class Plotter:
             special (bool, optional): A flag for special plots. Defaults to False.
             title (str, optional): The title of the plot. Defaults to "XP Over Time".
         """
-        self.fig, self.ax = plt.subplots(figsize=WINDOW_SIZE)
+        # A figure not managed by pyplot, so plots can be drawn in parallel threads
+        self.fig, self.ax = self.get_figure()
 
         self.active_threshold = active_threshold
 
@@ -143,6 +297,18 @@ class Plotter:
         self.max_xp = 0
         self.min_xp = 0
 
+        # Avatars fetched ahead of annotating, by URL
+        self.avatars: dict | None = None
+
+    def get_figure(self) -> tuple[Figure, Axes]:
+        """
+        Gets the figure to draw on. Plots with a different layout can override this.
+
+        Returns:
+            tuple: The figure and axes.
+        """
+        return FigureTemplate.acquire()
+
     def get_data(self, limit: int, include: set[int] = None) -> list:
         """
         Retrieves data from the database within the specified range.
@@ -168,6 +334,11 @@ class Plotter:
         """
         max_count = limit if not include else len(include)
 
+        # Every series is drawn by a single LineCollection, which is much faster to build
+        # and rasterise than one Line2D per member.
+        lines = []
+        colours = []
+        fallback = colour_cycle()
         count: int = 0
         for profile, xs, ys in self.get_data(max_count, include):
             id, name, colour, avatar = profile
@@ -177,9 +348,11 @@ class Plotter:
             if len(xs) <= 1:
                 continue
 
+            colour = colour or next(fallback)
             self.annotations.append(
                 (ys[-1], name, colour, avatar, ys[0]))
-            plt.plot(xs, ys, color=colour)
+            lines.append(np.column_stack((date2num(xs), ys)))
+            colours.append(colour)
 
             count += 1
             if count >= max_count:
@@ -187,6 +360,10 @@ class Plotter:
         if count < max_count:
             logger.info(f"{count} profiles shown")
 
+        if lines:
+            self.ax.add_collection(LineCollection(lines, colors=colours))
+            self.ax.autoscale_view()
+
     def draw_events(self) -> None:
         """
         Draws event spans on the plot.
@@ -201,59 +378,47 @@ class Plotter:
 
             alpha = max(min(mult - 1, 1), 0)
 
-            plt.axvspan(start, end, color=Colours.highlight, alpha=alpha)
+            self.ax.axvspan(start, end, color=Colours.highlight, alpha=alpha)
 
-            plt.annotate(f"{mult}x", (start + (end - start) / 2, 1),
-                         xycoords=('data', 'axes fraction'),
-                         color=Colours.text,
-                         ha='center',
-                         va='top',
-                         family=fonts)
+            self.ax.annotate(f"{mult}x", (start + (end - start) / 2, 1),
+                             xycoords=('data', 'axes fraction'),
+                             color=Colours.text,
+                             ha='center',
+                             va='top',
+                             family=fonts)
 
     def annotate(self) -> None:
         """
         Adds names to the graph.
         Ensures the names are separated by at least 'GRAPH_SEPERATOR'.
         Requires at least 1 annotation.
+        All avatars are fetched together first, names without an avatar in time are shown alone.
         """
+        self.avatars = avatar_cache.get_many([item[3] for item in self.annotations])
+
         # Determine how to convert from xp to axes fraction.
         sorted_annotations = sorted(self.annotations, key=lambda x: x[0])
         self.max_xp = sorted_annotations[-1][0]
         self.min_xp = sorted_annotations[0][4]
 
+        heights = np.array([item[0] for item in sorted_annotations], dtype=float)
         if len(self.annotations) > 1:
-            def xp_to_axes(xp):
-                return (xp - self.min_xp) / (self.max_xp - self.min_xp)
-
-            def axes_to_data(h):
-                return h * (self.max_xp - self.min_xp) + self.min_xp
-
-        # Each point defaults to next to line.
-        # Moves up to avoid lower labels.
-        heights = [-GRAPH_SEPERATOR]
-        for item in sorted_annotations:
-            height = item[0]
-            position = 1.001 + GRAPH_IMAGE_WIDTH
-
-            if len(self.annotations) > 1:
-                label_height = xp_to_axes(height)
-                if label_height - heights[-1] < GRAPH_SEPERATOR:
-                    label_height = heights[-1] + GRAPH_SEPERATOR
-                heights.append(label_height)
-                label_height = axes_to_data(label_height)
-            else:
-                label_height = height
+            label_heights = separate_labels(heights, self.min_xp, self.max_xp)
+        else:
+            label_heights = heights
 
+        position = 1.001 + GRAPH_IMAGE_WIDTH
+        for item, height, label_height in zip(sorted_annotations, heights, label_heights):
             did_img = self.annotate_image(item[3], label_height)
 
             label_position = position if did_img else position - GRAPH_IMAGE_WIDTH
 
-            plt.annotate(item[1], (position, height),
-                         xytext=(label_position, label_height),
-                         xycoords=('axes fraction', 'data'),
-                         color=item[2],
-                         va='center',
-                         family=fonts)
+            self.ax.annotate(item[1], (position, height),
+                             xytext=(label_position, label_height),
+                             xycoords=('axes fraction', 'data'),
+                             color=item[2],
+                             va='center',
+                             family=fonts)
 
     def annotate_image(self, avatar: str, height: float) -> bool:
         """
@@ -266,12 +431,15 @@ class Plotter:
         Returns:
             bool: True if the image was added successfully, False otherwise.
         """
-        image = request_img(avatar)
-        if image is None:
+        if self.avatars is not None:
+            cached = self.avatars.get(avatar)
+        else:
+            cached = avatar_cache.get(avatar)
+        if cached is None:
             return False
 
-        image = plt.imread(image, format='jpeg')
-        image = OffsetImage(image, zoom=0.1)
+        image, zoom = cached
+        image = OffsetImage(image, zoom=zoom)
         annotation = AnnotationBbox(image, (1 + GRAPH_IMAGE_WIDTH / 2, height),
                                     xycoords=('axes fraction', 'data'),
                                     frameon=False)
@@ -291,24 +459,15 @@ class Plotter:
         self.ax.set_xlabel(f"Date ({str(dateformat)})", color=Colours.text)
         self.ax.set_ylabel("Total XP", color=Colours.text)
 
-        self.fig.patch.set_facecolor(Colours.outside)
-        self.ax.set_facecolor(Colours.inside)
-        self.ax.tick_params(colors=Colours.text)
-
-        for spine in self.ax.spines.values():
-            spine.set_visible(False)
-        plt.grid(visible=True, axis='y', color=Colours.outside)
-
-        self.fig.subplots_adjust(left=0.06, bottom=0.08, top=0.94, right=0.83)
-
+        # The colours, spines, grid and layout are already set by FigureTemplate
         if self.title:
-            plt.title(self.title, color=Colours.text)
+            self.ax.set_title(self.title, color=Colours.text)
 
     def show(self):
         """
-        Displays the plot.
+        Displays the plot in an image viewer.
         """
-        plt.show()
+        Image.open(BytesIO(self.render())).show()
 
     def save(self, name="out.png"):
         """
@@ -318,14 +477,35 @@ class Plotter:
             name (str, optional): The name of the file. Defaults to "out.png".
         """
         name = os.path.join(BASE_DIR, 'generated', name or 'out.png')
-        plt.savefig(name)
+        with open(name, 'wb') as file:
+            file.write(self.render())
         return name
 
+    def render(self, format: str = PLOT_FORMAT, colours: int = PLOT_PALETTE_COLOURS,
+               compress_level: int = PLOT_COMPRESS_LEVEL) -> bytes:
+        """
+        Renders the plot to an image in memory.
+
+        Args:
+            format (str, optional): 'png' or 'webp'. Defaults to PLOT_FORMAT.
+            colours (int, optional): The size of the palette to reduce to, or 0 to keep full colour.
+                Defaults to PLOT_PALETTE_COLOURS.
+            compress_level (int, optional): The png compression level, from 0 to 9.
+                Defaults to PLOT_COMPRESS_LEVEL.
+
+        Returns:
+            bytes: The encoded image.
+        """
+        self.fig.canvas.draw()
+        image = Image.frombuffer('RGBA', self.fig.canvas.get_width_height(),
+                                 self.fig.canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1).convert('RGB')
+        return encode(image, format, colours, compress_level)
+
     def close(self):
         """
-        Closes the plot.
+        Closes the plot, handing its figure back for the next plot.
         """
-        plt.close()
+        FigureTemplate.release(self.fig)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,203 @@
+import os
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.dates import date2num, num2date
+from matplotlib.transforms import blended_transform_factory
+from PIL import Image
+
+from gwaff.custom_logger import Logger
+from gwaff.plotter.growth import Growth
+from gwaff.plotter.plotter import Colours, GRAPH_DEFAULT_USERS, colour_cycle, fonts, separate_labels
+
+logger = Logger('gwaff.plotter.race')
+
+RACE_FRAMES: int = int(os.environ.get("RACE_FRAMES", 60))
+RACE_FPS: int = int(os.environ.get("RACE_FPS", 15))
+RACE_HOLD_MS: int = 2000  # How long the last frame is shown before looping
+RACE_DPI: int = int(os.environ.get("RACE_DPI", 60))
+RACE_MAX_SECONDS: float = float(os.environ.get("RACE_MAX_SECONDS", 20))
+RACE_MAX_MB: float = float(os.environ.get("RACE_MAX_MB", 8))
+
+
+class Race(Growth):
+    """
+    An animated growth plot, where the lines grow over the window and the names follow them.
+    The static parts are drawn once and every frame only redraws the lines and labels on top.
+    Frames are drawn as Pillow encodes the GIF, which stores only the part of each frame that changed.
+
+    Attributes:
+        lines (LineCollection | None): The lines of every member.
+        labels (list): The name of each member, in the same order as series.
+        series (list): The times and growth of each member, as arrays.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dpi = self.fig.get_dpi()
+        self.fig.set_dpi(RACE_DPI)
+
+        self.lines: LineCollection | None = None
+        self.labels = []
+        self.series: list[tuple[np.ndarray, np.ndarray]] = []
+        self.clock = None
+
+    def draw(self, limit: int = GRAPH_DEFAULT_USERS, include: set[int] = None) -> None:
+        """
+        Prepares the lines and labels to animate.
+
+        Args:
+            limit (int, optional): The maximum number of users to plot. Defaults to GRAPH_DEFAULT_USERS.
+            include (set[int], optional): If specified, only includes the specified user IDs. Defaults to None.
+
+        Throws:
+            IndexError: If none of the users have enough data to plot.
+        """
+        colours = []
+        fallback = colour_cycle()
+        for profile, xs, ys in self.get_data(limit, include):
+            id, name, colour, avatar = profile
+            if len(xs) <= 1:
+                continue
+            colour = colour or next(fallback)
+            self.series.append((date2num(xs), np.asarray(ys, dtype=float)))
+            colours.append(colour)
+            self.labels.append(self.ax.text(1.005, 0, name, color=colour, va='center', family=fonts,
+                                            transform=blended_transform_factory(self.ax.transAxes,
+                                                                                self.ax.transData),
+                                            animated=True))
+        if not self.series:
+            raise IndexError("No members to plot")
+
+        self.lines = LineCollection([], colors=colours, animated=True)
+        self.ax.add_collection(self.lines)
+        self.clock = self.ax.text(0.01, 0.97, '', transform=self.ax.transAxes, color=Colours.text,
+                                  va='top', family=fonts, animated=True)
+
+    def configure(self) -> None:
+        """
+        Configures the plot, fixing the axes to the final values so they do not move between frames.
+        """
+        self.max_xp = max(ys[-1] for _, ys in self.series)
+        super().configure()
+
+    def frame(self, now: float) -> None:
+        """
+        Moves the lines and labels to a point in time.
+
+        Args:
+            now (float): The time, as a matplotlib date number.
+        """
+        segments = []
+        heights = np.empty(len(self.series))
+        for i, (xs, ys) in enumerate(self.series):
+            end = np.searchsorted(xs, now, side='right')
+            height = np.interp(now, xs, ys)
+            segments.append(np.vstack((np.column_stack((xs[:end], ys[:end])), (now, height))))
+            heights[i] = height
+        self.lines.set_segments(segments)
+
+        order = np.argsort(heights, kind='stable')
+        low, high = self.ax.get_ylim()
+        label_heights = separate_labels(heights[order], low, high)
+        for index, label_height in zip(order, label_heights):
+            self.labels[index].set_y(label_height)
+        self.clock.set_text(num2date(now).strftime('%Y-%m-%d %H:%M'))
+
+    def animate(self, frames: int = RACE_FRAMES, fps: int = RACE_FPS,
+                max_seconds: float = RACE_MAX_SECONDS, max_mb: float = RACE_MAX_MB) -> bytes:
+        """
+        Draws the animation as a looping GIF.
+        If the time or size budget runs out, the animation skips to its last frame.
+
+        Args:
+            frames (int, optional): The number of frames. Defaults to RACE_FRAMES.
+            fps (int, optional): The frames per second. Defaults to RACE_FPS.
+            max_seconds (float, optional): The time budget. Defaults to RACE_MAX_SECONDS.
+            max_mb (float, optional): The size budget. Defaults to RACE_MAX_MB.
+
+        Returns:
+            bytes: The GIF.
+        """
+        deadline = time.perf_counter() + max_seconds
+        max_bytes = max_mb * 1024 * 1024
+        canvas = self.fig.canvas
+
+        # The axes, ticks, title and events are drawn once
+        canvas.draw()
+        background = canvas.copy_from_bbox(self.fig.bbox)
+
+        def draw_frame(now: float) -> Image.Image:
+            self.frame(now)
+            canvas.restore_region(background)
+            self.ax.draw_artist(self.lines)
+            for artist in [*self.labels, self.clock]:
+                self.ax.draw_artist(artist)
+            return Image.frombuffer('RGBA', canvas.get_width_height(), canvas.buffer_rgba(),
+                                    'raw', 'RGBA', 0, 1).convert('RGB')
+
+        start = min(xs[0] for xs, _ in self.series)
+        end = date2num(self.end_date or datetime.now())
+        times = np.linspace(start, end, max(frames, 2))
+
+        # The last frame has every colour, so its palette is shared by the whole animation
+        palette = draw_frame(times[-1]).quantize(255, method=Image.Quantize.FASTOCTREE)
+
+        def quantized(now: float, last: bool) -> Image.Image:
+            image = draw_frame(now).quantize(palette=palette, dither=Image.Dither.NONE)
+            image.info['duration'] = RACE_HOLD_MS if last else round(1000 / fps)
+            return image
+
+        def encoded_size(image: Image.Image) -> int:
+            file = BytesIO()
+            image.save(file, format='GIF')
+            return file.tell()
+
+        def rest(first: Image.Image):
+            # Pillow only writes the file once every frame is drawn, so the size is measured by
+            # encoding the part of each frame that changed, which is what it stores
+            size = encoded_size(first)
+            previous = np.asarray(first)
+            for i, now in enumerate(times[1:], 1):
+                last = i == len(times) - 1
+                if not last and (time.perf_counter() > deadline or size > max_bytes):
+                    logger.warning(f"Race budget used after {i} of {len(times)} frames")
+                    now, last = times[-1], True
+
+                image = quantized(now, last)
+                pixels = np.asarray(image)
+                changed = pixels != previous
+                rows, cols = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+                if len(rows):
+                    size += encoded_size(image.crop((cols[0], rows[0], cols[-1] + 1, rows[-1] + 1)))
+                previous = pixels
+                yield image
+                if last:
+                    break
+
+        first = quantized(times[0], False)
+        output = BytesIO()
+        # The frames already share a palette, so it is not optimised for each one
+        first.save(output, format='GIF', save_all=True, append_images=rest(first),
+                   loop=0, disposal=1, optimize=False)
+        return output.getvalue()
+
+    def close(self):
+        """
+        Closes the plot, restoring the resolution of the shared figure.
+        """
+        self.fig.set_dpi(self.dpi)
+        super().close()
+
+
+if __name__ == '__main__':
+    plot = Race(start_date=datetime.now() - timedelta(days=7), title="Top chatters XP race")
+    plot.draw()
+    plot.draw_events()
+    plot.configure()
+    with open('race.gif', 'wb') as file:
+        file.write(plot.animate())
+    plot.close()
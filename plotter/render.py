@@ -0,0 +1,441 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from threading import Lock
+
+from gwaff.custom_logger import Logger
+from gwaff.database.db_base import DatabaseReader
+from gwaff.metrics import MetricsHistory
+
+logger = Logger('gwaff.plotter.render')
+
+RENDER_WORKERS: int = int(os.environ.get("RENDER_WORKERS", 2))
+RENDER_TIMEOUT: float = float(os.environ.get("RENDER_TIMEOUT", 60))  # Seconds before a render is abandoned
+RENDER_CACHE_MB: float = float(os.environ.get("RENDER_CACHE_MB", 32))
+
+
+def warm_worker() -> None:
+    """
+    Prepares a render worker so its first plot is as fast as the rest.
+    Importing the plotter registers the fonts and builds matplotlib's font cache,
+    and drawing a throwaway figure loads the fonts and the Agg backend.
+    The avatars of the top chatters are loaded into the worker's own avatar cache.
+    """
+    from gwaff.plotter.avatars import avatar_cache, AVATAR_DEADLINE
+    from gwaff.plotter.fast import text_mask
+    from gwaff.plotter.plotter import Plotter
+
+    plot = Plotter(title="Warmup")
+    plot.fig.canvas.draw()
+    plot.close()
+    text_mask("XP Growth")
+    avatar_cache.prewarm(deadline=AVATAR_DEADLINE)
+
+
+def warm_up() -> None:
+    """
+    Prepares the bot process for its first plot, so the first command after a restart
+    is as fast as the rest. Starts the render workers, which warm themselves and load
+    the avatars, and opens the database.
+    When plots are drawn in threads, the plotting stack is warmed here instead.
+    """
+    render_service.start()
+    if render_service.workers <= 0:
+        warm_worker()
+    data_version()
+
+
+def render_growth(days: float, count: int, include: set[int] | None = None,
+                  title: str = "Top chatters XP growth", special: bool = False) -> bytes:
+    """
+    Plots a growth plot (aka gwaff). Runs inside a render worker.
+    Plots of only a few members are drawn directly with Pillow, which is much quicker.
+
+    Args:
+        days (float): Number of days to plot.
+        count (int): Number of users to plot.
+        include (set[int], optional): If specified, only plots these user IDs. Defaults to None.
+        title (str, optional): Title of the plot. Defaults to "Top chatters XP growth".
+        special (bool, optional): Whether to use special plotting settings. Defaults to False.
+
+    Returns:
+        bytes: The plot as an image in PLOT_FORMAT.
+
+    Throws:
+        IndexError: If none of the users have enough data to plot.
+    """
+    from gwaff.plotter.fast import FastGrowth, FAST_MAX_SERIES
+    from gwaff.plotter.growth import Growth
+
+    series = len(include) if include else count
+    plotter = FastGrowth if series <= FAST_MAX_SERIES else Growth
+    plot = plotter(start_date=datetime.now() - timedelta(days=days),
+                   special=special,
+                   title=title)
+    try:
+        plot.draw(limit=count, include=include)
+        plot.draw_events()
+        plot.annotate()
+        plot.configure()
+        return plot.render()
+    finally:
+        plot.close()
+
+
+def render_density(days: float, count: int, title: str = "Everyone's XP growth") -> bytes:
+    """
+    Plots the growth of every member who gained xp, labelling the top members.
+    Runs inside a render worker.
+
+    Args:
+        days (float): Number of days to plot.
+        count (int): Number of top users to draw and label.
+        title (str, optional): Title of the plot. Defaults to "Everyone's XP growth".
+
+    Returns:
+        bytes: The plot as an image in PLOT_FORMAT.
+
+    Throws:
+        IndexError: If nobody gained xp in the range.
+    """
+    from gwaff.plotter.density import Density
+
+    plot = Density(start_date=datetime.now() - timedelta(days=days), title=title)
+    try:
+        plot.draw(limit=count)
+        plot.draw_events()
+        plot.annotate()
+        plot.configure()
+        return plot.render()
+    finally:
+        plot.close()
+
+
+def render_race(days: float, count: int, title: str = "Top chatters XP race") -> bytes:
+    """
+    Animates the growth of the top chatters. Runs inside a render worker.
+
+    Args:
+        days (float): Number of days to animate.
+        count (int): Number of users to plot.
+        title (str, optional): Title of the plot. Defaults to "Top chatters XP race".
+
+    Returns:
+        bytes: The animation as a GIF.
+
+    Throws:
+        IndexError: If none of the users have enough data to plot.
+    """
+    from gwaff.plotter.race import Race
+
+    plot = Race(start_date=datetime.now() - timedelta(days=days), title=title)
+    try:
+        plot.draw(limit=count)
+        plot.draw_events()
+        plot.configure()
+        return plot.animate()
+    finally:
+        plot.close()
+
+
+def render_activity(days: float, member: int | None = None, title: str = "Server activity") -> bytes:
+    """
+    Plots a calendar of daily xp gain. Runs inside a render worker.
+
+    Args:
+        days (float): Number of days to plot.
+        member (int, optional): The ID of the member to plot, or None for everyone. Defaults to None.
+        title (str, optional): Title of the plot. Defaults to "Server activity".
+
+    Returns:
+        bytes: The plot as an image in PLOT_FORMAT.
+
+    Throws:
+        IndexError: If there are no records in the range.
+    """
+    from gwaff.plotter.activity import Activity
+    from gwaff.plotter.plotter import Colours
+
+    include, colour = None, Colours.text
+    if member is not None:
+        include = {member}
+        profile = DatabaseReader().get_profile_data(member)
+        if profile is not None and profile.colour:
+            colour = profile.colour
+
+    plot = Activity(start_date=datetime.now() - timedelta(days=days), title=title)
+    try:
+        plot.draw(include=include, colour=colour)
+        plot.configure()
+        return plot.render()
+    finally:
+        plot.close()
+
+
+class RenderCache:
+    """
+    An in-memory LRU of rendered images, limited by their total size.
+    Keys should include the data version, so entries are never stale, only unused.
+
+    Attributes:
+        max_bytes (int): The most image bytes to hold.
+        images (OrderedDict): The images by key, least recently used first.
+        hits (int): The number of requests served from the cache.
+        shared (int): The number of requests that joined an identical render in progress.
+        misses (int): The number of requests that had to be rendered.
+    """
+
+    def __init__(self, max_mb: float = RENDER_CACHE_MB):
+        """
+        Initialises the cache.
+
+        Args:
+            max_mb (float, optional): The size limit in megabytes. Defaults to RENDER_CACHE_MB.
+        """
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.images: OrderedDict[tuple, bytes] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> bytes | None:
+        """
+        Gets an image, counting the hit or miss.
+
+        Args:
+            key (tuple): The key of the image.
+
+        Returns:
+            bytes: The image, or None if it is not cached.
+        """
+        image = self.images.get(key)
+        if image is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.images.move_to_end(key)
+        return image
+
+    def put(self, key: tuple, image: bytes) -> None:
+        """
+        Adds an image, evicting the least recently used images if the cache is full.
+
+        Args:
+            key (tuple): The key of the image.
+            image (bytes): The image.
+        """
+        if len(image) > self.max_bytes:
+            return
+        if key in self.images:
+            self.bytes -= len(self.images.pop(key))
+        self.images[key] = image
+        self.bytes += len(image)
+        while self.bytes > self.max_bytes:
+            _, evicted = self.images.popitem(last=False)
+            self.bytes -= len(evicted)
+
+    def hit_rate(self) -> float:
+        """
+        Finds the fraction of requests that did not need a render of their own,
+        either served from the cache or sharing a render in progress.
+
+        Returns:
+            float: The hit rate, from 0 to 1.
+        """
+        total = self.hits + self.shared + self.misses
+        return (self.hits + self.shared) / total if total else 0
+
+
+class RenderService:
+    """
+    A pool of warm worker processes that render plots away from the event loop,
+    so several graphs can be drawn at once without blocking other commands.
+    With no workers, plots are rendered in threads of the bot process instead.
+
+    Attributes:
+        workers (int): The number of worker processes.
+        executor (ProcessPoolExecutor | None): The worker pool, started on first use.
+        lock (Lock): Held while starting or stopping the pool.
+        cache (RenderCache): Recently rendered images, keyed by their arguments and the data version.
+        metrics (MetricsHistory): The time taken and whether the cache was used for recent requests.
+    """
+
+    def __init__(self, workers: int = RENDER_WORKERS):
+        """
+        Initialises the service. The workers are not started until needed.
+
+        Args:
+            workers (int, optional): The number of worker processes. Defaults to RENDER_WORKERS.
+        """
+        self.workers = workers
+        self.executor: ProcessPoolExecutor | None = None
+        # The warm up thread and the event loop may both start the pool
+        self.lock = Lock()
+        self.cache = RenderCache()
+        self.pending: dict[tuple, asyncio.Future] = {}
+        self.metrics = MetricsHistory()
+
+    def start(self) -> None:
+        """
+        Starts the worker processes if they are not running.
+        Workers are spawned rather than forked, as the bot process has threads of its own.
+        Safe to call from several threads at once.
+        """
+        with self.lock:
+            if self.executor is None and self.workers > 0:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                    mp_context=multiprocessing.get_context('spawn'),
+                                                    initializer=warm_worker)
+                # Start every worker now rather than on the first requests
+                for _ in range(self.workers):
+                    self.executor.submit(int)
+                logger.info(f"Started {self.workers} render workers")
+
+    def close(self) -> None:
+        """
+        Stops the worker processes.
+        """
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+    async def render(self, func, *args, **kwargs) -> bytes:
+        """
+        Runs a render function in a worker and waits for the image.
+        The pool is restarted once if a worker has died.
+
+        Args:
+            func (Callable): A module level function returning the image.
+            *args: Arguments for the function.
+            **kwargs: Keyword arguments for the function.
+
+        Returns:
+            bytes: The image.
+
+        Throws:
+            TimeoutError: If the render took longer than RENDER_TIMEOUT.
+        """
+        if self.workers <= 0:
+            return await asyncio.wait_for(asyncio.to_thread(func, *args, **kwargs), RENDER_TIMEOUT)
+
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            self.start()
+            future = loop.run_in_executor(self.executor, _call, func, args, kwargs)
+            try:
+                return await asyncio.wait_for(future, RENDER_TIMEOUT)
+            except BrokenProcessPool:
+                logger.warning("A render worker died, restarting the pool")
+                self.close()
+                if attempt:
+                    raise
+
+    async def cached(self, func, *args, **kwargs) -> bytes:
+        """
+        Gets an image from the cache, or renders it in a worker if the data has
+        changed since it was last rendered.
+
+        Args:
+            func (Callable): A module level function returning the image.
+            *args: Arguments for the function.
+            **kwargs: Keyword arguments for the function.
+
+        Returns:
+            bytes: The image.
+        """
+        start = time.perf_counter()
+        version = await asyncio.to_thread(data_version)
+        key = (func.__name__, version, args,
+               tuple(sorted((name, frozenset(value) if isinstance(value, set) else value)
+                            for name, value in kwargs.items())))
+        # Identical requests arriving together share one render
+        task = self.pending.get(key)
+        if task is not None:
+            self.cache.shared += 1
+            image = await asyncio.shield(task)
+            hit = True
+        else:
+            image = self.cache.get(key)
+            hit = image is not None
+            if not hit:
+                task = asyncio.ensure_future(self.render(func, *args, **kwargs))
+                self.pending[key] = task
+                task.add_done_callback(lambda _: self.pending.pop(key, None))
+                image = await asyncio.shield(task)
+                self.cache.put(key, image)
+
+        self.metrics.add({'render_time': time.perf_counter() - start,
+                          'hit': int(hit),
+                          'bytes': len(image)})
+        return image
+
+    async def growth(self, days: float, count: int, include: set[int] | None = None,
+                     title: str = "Top chatters XP growth", special: bool = False) -> bytes:
+        """
+        Renders a growth plot in a worker, or gets it from the cache.
+        Takes the arguments of render_growth.
+
+        Returns:
+            bytes: The plot as an image in PLOT_FORMAT.
+        """
+        return await self.cached(render_growth, days=days, count=count, include=include,
+                                 title=title, special=special)
+
+    async def density(self, days: float, count: int, title: str = "Everyone's XP growth") -> bytes:
+        """
+        Renders the growth of every member in a worker, or gets it from the cache.
+        Takes the arguments of render_density.
+
+        Returns:
+            bytes: The plot as an image in PLOT_FORMAT.
+        """
+        return await self.cached(render_density, days=days, count=count, title=title)
+
+    async def activity(self, days: float, member: int | None = None,
+                       title: str = "Server activity") -> bytes:
+        """
+        Renders an activity calendar in a worker, or gets it from the cache.
+        Takes the arguments of render_activity.
+
+        Returns:
+            bytes: The plot as an image in PLOT_FORMAT.
+        """
+        return await self.cached(render_activity, days=days, member=member, title=title)
+
+    async def race(self, days: float, count: int, title: str = "Top chatters XP race") -> bytes:
+        """
+        Animates a race in a worker, or gets it from the cache.
+        Takes the arguments of render_race.
+
+        Returns:
+            bytes: The animation as a GIF.
+        """
+        return await self.cached(render_race, days=days, count=count, title=title)
+
+
+def data_version():
+    """
+    Finds the version of the data, which changes with every collection,
+    as held values are drawn up to the last collection.
+
+    Returns:
+        datetime: The most recent collection time.
+    """
+    return DatabaseReader().get_last_collection()
+
+
+def _call(func, args: tuple, kwargs: dict):
+    """
+    Calls a function with its arguments. Used as run_in_executor only takes positional arguments.
+    """
+    return func(*args, **kwargs)
+
+
+render_service = RenderService()
@@ -1,11 +1,15 @@
 import os
+from bisect import bisect_right
 from datetime import datetime, timedelta
-from math import floor
+
+import numpy as np
 
 from gwaff.database.db_base import DatabaseReader
 
 PREDICTOR_DEFAULT_DAYS: int = int(os.environ.get("PREDICTOR_DEFAULT_DAYS", 30))
 MAX_TARGET_DISTANCE: int = int(os.environ.get("MAX_TARGET_DISTANCE", 100 * 365))
+THREATS_DEFAULT_COUNT: int = int(os.environ.get("THREATS_DEFAULT_COUNT", 5))
+MAX_LEVEL: int = 10_000
 
 
 class NoDataError(Exception):
@@ -28,36 +32,36 @@ class TargetBoundsError(Exception):
     ...
 
 
-def lvl_to_xp(lvl: int) -> int:
+def lvl_to_xp(lvl: int | np.ndarray) -> int | np.ndarray:
     """
     Converts a level to the equivalent xp value.
+    Each level takes 5l²+50l+100 more xp than the last, so this is the exact sum of those steps.
 
-    lvl: The level to convert to an xp value.
+    Args:
+        lvl (int | np.ndarray): The level, or an array of levels, to convert to xp.
 
     Returns: The xp value required for the given level.
     """
-    xp = (1.667 * lvl ** 3) + (22.5 * lvl ** 2) + (75.833 * lvl)
-    return 5 * round(xp / 5)
+    return 5 * lvl * (lvl - 1) * (2 * lvl - 1) // 6 + 25 * lvl * (lvl - 1) + 100 * lvl
+
+
+# The xp at which each level is reached, for looking up levels
+LEVEL_XP: np.ndarray = lvl_to_xp(np.arange(MAX_LEVEL + 1, dtype=np.int64))
 
 
-def xp_to_lvl(xp: int) -> int:
+def xp_to_lvl(xp: int | np.ndarray) -> int | np.ndarray:
     """
-    Converts an xp value to the equivalent level.
-    Behaviour is only correct when xp>12017 and level<100.
+    Converts an xp value to the equivalent level, by looking it up in LEVEL_XP.
+    Levels above MAX_LEVEL are given as MAX_LEVEL.
 
     Args:
-        xp (int): The xp value to convert to a level.
+        xp (int | np.ndarray): The xp value, or an array of xp values, to convert to a level.
 
     Returns: The level at the given xp.
     """
-    if xp <= 145000:
-        # If xp is relatively low (<=lvl39) use this approximation
-        A, B, C = 6.204, 2.724, 2079
-    else:
-        # If xp is relatively high (>lvl39) use separate approximation
-        A, B, C = 3.207, 2.885, 12727
-
-    return floor(((xp - C) / A) ** (1 / B))
+    if np.ndim(xp) == 0:
+        return max(bisect_right(LEVEL_XP, xp) - 1, 0)
+    return np.maximum(np.searchsorted(LEVEL_XP, xp, side='right') - 1, 0)
 
 
 def remove_suffix(value: str) -> int:
@@ -110,14 +114,17 @@ def parse_target(target: str) -> tuple:
 class Predictor:
     """
     Class that gets average growth data.
+    The growth is found from the ends of each row, using one reader for every lookup.
     """
 
     def __init__(self, member: int,
                  period: int = PREDICTOR_DEFAULT_DAYS,
-                 growth: int = None) -> None:
+                 growth: int = None,
+                 dbr: DatabaseReader = None) -> None:
         self.member = member
         self.period = period
         self.start_date = datetime.now() - timedelta(days=period)
+        self.dbr = dbr or DatabaseReader()
 
         # Get growth data for the member
         self.value, self.growth = self.get_data(member)
@@ -125,8 +132,7 @@ class Predictor:
             self.growth = growth
 
     def get_data(self, user: int) -> tuple:
-        dbr = DatabaseReader()
-        row = dbr.get_row(user, self.start_date)
+        row = self.dbr.get_endpoints(user, self.start_date)
 
         if len(row) <= 1:
             raise NoDataError('There is no data for this user within range')
@@ -153,8 +159,9 @@ class TargetPrediction(Predictor):
     def __init__(self, member: int,
                  target: str,
                  period: int = PREDICTOR_DEFAULT_DAYS,
-                 growth: int = None):
-        super().__init__(member, period, growth)
+                 growth: int = None,
+                 dbr: DatabaseReader = None):
+        super().__init__(member, period, growth, dbr)
 
         # Validate and process the target
         self.target_type, self.target, self.relative = parse_target(target)
@@ -204,8 +211,9 @@ class TargetPrediction(Predictor):
 class Forecast(Predictor):
     def __init__(self, member: int, days: int,
                  period: int = PREDICTOR_DEFAULT_DAYS,
-                 growth: int = None):
-        super().__init__(member, period, growth)
+                 growth: int = None,
+                 dbr: DatabaseReader = None):
+        super().__init__(member, period, growth, dbr)
         self.days = days
 
     def evaluate(self) -> int:
@@ -213,25 +221,82 @@ class Forecast(Predictor):
 
 
 class Threats(Predictor):
-    def evaluate(self) -> list[tuple[int, float]]:
-        dbr = DatabaseReader()
-        for user in dbr.get_last_record():
-            if user == self.member:
-                pass
-            try:
-                prediction = TargetPrediction(self.member, f"<@{user[0].id}>").evaluate()
-                if prediction > 0:
-                    print(prediction)
-                    results.append((user[0], prediction))
-            except ZeroGrowthError:
-                pass
-            except TargetBoundsError:
-                pass
-            except NoDataError:
-                pass
-            except ZeroDivisionError:
-                pass
-        return results
+    """
+    Finds who will overtake the member and who the member will overtake.
+    Every member's growth is loaded in a single query and all the intercepts are found at once.
+
+    Attributes:
+        ids (np.ndarray): The ID of each member with growth data.
+        values (np.ndarray): The current xp of each member.
+        rates (np.ndarray): The average daily growth of each member.
+    """
+
+    def __init__(self, member: int,
+                 period: int = PREDICTOR_DEFAULT_DAYS,
+                 growth: int = None,
+                 dbr: DatabaseReader = None):
+        self.ids: np.ndarray | None = None
+        self.values: np.ndarray | None = None
+        self.rates: np.ndarray | None = None
+        super().__init__(member, period, growth, dbr)
+
+    def load(self) -> None:
+        """
+        Loads the current xp and average growth of every member over the period.
+        Members with only one record in the period are left out.
+        """
+        ends = self.dbr.get_all_endpoints(self.start_date)
+        rows = list(ends.values())
+        ids = np.fromiter(ends, dtype=np.int64, count=len(ends))
+        start_xp = np.array([start_value for _, start_value, _, _ in rows], dtype=float)
+        final_xp = np.array([final_value for _, _, _, final_value in rows], dtype=float)
+        actual_period = np.array([(final_date - start_date) / timedelta(days=1)
+                                  for start_date, _, final_date, _ in rows], dtype=float)
+
+        keep = actual_period > 0
+        self.ids = ids[keep]
+        self.values = final_xp[keep]
+        self.rates = (final_xp[keep] - start_xp[keep]) / actual_period[keep]
+
+    def get_data(self, user: int) -> tuple:
+        """
+        Finds a member's current xp and growth from the loaded data.
+        Unlike other predictions, a member with no growth can still be overtaken.
+
+        Throws:
+            NoDataError: If the member has no growth data in the period.
+        """
+        if self.ids is None:
+            self.load()
+        index = np.flatnonzero(self.ids == user)
+        if len(index) == 0:
+            raise NoDataError('There is no data for this user within range')
+        return self.values[index[0]], self.rates[index[0]]
+
+    def evaluate(self, count: int = THREATS_DEFAULT_COUNT) -> tuple[list[tuple[int, float]],
+                                                                     list[tuple[int, float]]]:
+        """
+        Finds the members closest to overtaking the member, and closest to being overtaken.
+
+        Args:
+            count (int, optional): The number of each to find. Defaults to THREATS_DEFAULT_COUNT.
+
+        Returns:
+            tuple: The threats and the targets, as lists of member IDs and the days until they pass, soonest first.
+        """
+        others = self.ids != self.member
+        ids = self.ids[others]
+        gaps = self.values[others] - self.value
+        # m1x+c1 = m2x+c2, so x = (c2-c1)/(m1-m2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            days = gaps / (self.growth - self.rates[others])
+        passing = (days > 0) & (days < MAX_TARGET_DISTANCE)
+
+        def soonest(mask: np.ndarray) -> list[tuple[int, float]]:
+            order = np.argsort(days[mask], kind='stable')[:count]
+            return [(int(id), float(day)) for id, day in zip(ids[mask][order], days[mask][order])]
+
+        return soonest(passing & (gaps < 0)), soonest(passing & (gaps > 0))
 
 
 if __name__ == '__main__':
@@ -240,30 +305,15 @@ if __name__ == '__main__':
     assert lvl_to_xp(43) >= 177373
     assert xp_to_lvl(180000) == 43
     assert xp_to_lvl(189870) == 44
+    assert xp_to_lvl(0) == 0 and xp_to_lvl(99) == 0 and xp_to_lvl(100) == 1
+    assert all(xp_to_lvl(np.array([11824, 11825, 188870])) == [14, 15, 44])
 
     print(TargetPrediction(344731282095472641, '100').evaluate())
 
-    from database.db_base import DatabaseReader
-
-    results = []
-
     dbr = DatabaseReader()
-    for user in dbr.get_last_record():
-        # if user[1] >= 2122121:
-        #     continue
-        try:
-            prediction = TargetPrediction(298294667219435521, f"<@{user[0].id}>").evaluate()
-            if prediction > 0:
-                print(prediction)
-                results.append((user[0], prediction))
-        except ZeroGrowthError:
-            pass
-        except TargetBoundsError:
-            pass
-        except NoDataError:
-            pass
-        except ZeroDivisionError:
-            pass
-    results.sort(key=lambda x: x[1])
-    for user, prediction in results[0:100]:
-        print(f'{user.name}: {round(prediction)}')
+    names = {profile.id: profile.name for profile in dbr.get_profile_data()}
+    threats, targets = Threats(298294667219435521, dbr=dbr).evaluate(count=100)
+    for title, results in (('Threats', threats), ('Targets', targets)):
+        print(title)
+        for id, prediction in results:
+            print(f'{names[id]}: {round(prediction)}')
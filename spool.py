@@ -0,0 +1,143 @@
+import json
+import os
+from threading import Lock
+
+from gwaff.custom_logger import Logger
+
+logger = Logger('gwaff.spool')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SPOOL_PATH: str = os.path.join(BASE_DIR, 'database', os.environ.get('SPOOL_NAME', 'spool.jsonl'))
+
+
+class Spool:
+    """
+    An append-only file of collected pages that have not yet been saved to the database.
+    New entries are appended to the spool file. When draining, the spool file is moved aside
+    so fetching can continue while the moved entries are written, and only removed once they
+    have all been saved.
+
+    Entries that repeatedly fail to save are moved to a quarantine file, so they do not hold
+    up the rest. They can be appended back to the spool file to try again.
+
+    Attributes:
+        path (str): The path of the spool file.
+        draining_path (str): The path of the spool file while it is being drained.
+        quarantine_path (str): The path of the entries that could not be saved.
+    """
+
+    def __init__(self, path: str = SPOOL_PATH):
+        """
+        Initialises the spool.
+
+        Args:
+            path (str, optional): The path of the spool file. Defaults to SPOOL_PATH.
+        """
+        self.path = path
+        self.draining_path = path + '.draining'
+        self.quarantine_path = path + '.failed'
+        self.lock = Lock()
+
+    def append(self, entry: dict) -> None:
+        """
+        Appends an entry to the spool and flushes it to disk.
+
+        Args:
+            entry (dict): The JSON serialisable entry to append.
+        """
+        self.extend([entry])
+
+    def extend(self, entries: list[dict]) -> None:
+        """
+        Appends several entries to the spool and flushes them to disk together.
+
+        Args:
+            entries (list): The JSON serialisable entries to append.
+        """
+        lines = ''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries)
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(lines)
+                file.flush()
+                os.fsync(file.fileno())
+
+    def take(self) -> list[dict]:
+        """
+        Moves the spooled entries aside to be drained, including any left over from
+        a previous drain that did not finish.
+
+        Returns:
+            list: The entries to drain, oldest first.
+        """
+        with self.lock:
+            if os.path.exists(self.path):
+                if os.path.exists(self.draining_path):
+                    with open(self.path, 'r', encoding='utf-8') as new, \
+                            open(self.draining_path, 'a', encoding='utf-8') as draining:
+                        draining.write(new.read())
+                    os.remove(self.path)
+                else:
+                    os.replace(self.path, self.draining_path)
+
+        if not os.path.exists(self.draining_path):
+            return []
+
+        entries = []
+        with open(self.draining_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Most likely a partial line from a crash while appending
+                    logger.warning("Skipping malformed spool entry")
+        return entries
+
+    def done(self, remaining: list[dict]) -> None:
+        """
+        Marks the drained entries as saved, keeping any that are remaining.
+
+        Args:
+            remaining (list): The taken entries that have not been saved.
+        """
+        if not remaining:
+            if os.path.exists(self.draining_path):
+                os.remove(self.draining_path)
+            return
+
+        temp_path = self.draining_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            for entry in remaining:
+                file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.draining_path)
+
+    def quarantine(self, entries: list[dict]) -> None:
+        """
+        Moves entries that could not be saved aside. They should then be
+        left out of the remaining entries given to done.
+
+        Args:
+            entries (list): The entries to set aside.
+        """
+        with open(self.quarantine_path, 'a', encoding='utf-8') as file:
+            for entry in entries:
+                file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    def __len__(self) -> int:
+        """
+        Counts the entries waiting in the spool.
+
+        Returns:
+            int: The number of entries.
+        """
+        count = 0
+        for path in (self.draining_path, self.path):
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as file:
+                    count += sum(1 for line in file if line.strip())
+        return count
@@ -1,10 +1,15 @@
+import codecs
 import json
+import os
 import time
 from io import BytesIO
+from threading import Lock
+from typing import Any, Iterable, Iterator
 from urllib.parse import urlencode
 
 import discord
 import requests
+from requests.adapters import HTTPAdapter
 
 from gwaff.custom_logger import Logger
 from gwaff.database.db_base import DatabaseReader
@@ -13,14 +18,60 @@ logger = Logger('gwaff.utils')
 
 MAX_RETRIES = 5
 
+HTTP_POOL_CONNECTIONS: int = int(os.environ.get("HTTP_POOL_CONNECTIONS", 10))
+HTTP_POOL_MAXSIZE: int = int(os.environ.get("HTTP_POOL_MAXSIZE", 10))
+HTTP_USER_AGENT: str = "Mozilla/5.0"
+STREAM_CHUNK_SIZE: int = 16 * 1024  # Bytes to read at a time when streaming a response
 
-def retry_request(request_func, url, **kwargs):
+_session: requests.Session | None = None
+_session_lock = Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Gets the shared HTTP session used for all outbound requests.
+    Connections are kept alive and pooled per host, so repeated requests
+    to the same host skip the DNS, TCP and TLS setup.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS,
+                                      pool_maxsize=HTTP_POOL_MAXSIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({"User-Agent": HTTP_USER_AGENT,
+                                        "Accept-Encoding": "gzip, deflate"})
+                _session = session
+    return _session
+
+
+def close_session() -> None:
+    """
+    Closes the shared HTTP session and its pooled connections.
+    A new session is created on the next request.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def retry_request(request_func, url, stats: dict = None, **kwargs):
     """
     Handles retry logic for making requests.
 
     Args:
-        request_func (function): Function to call for the request (e.g., requests.get).
+        request_func (function): Function to call for the request (e.g., get_session().get).
         url (str): The URL to request.
+        stats (dict, optional): If given, the number of 'attempts' and the 'latency' in seconds
+            of the successful attempt are stored in it.
         kwargs (dict): Additional arguments for the request.
 
     Returns:
@@ -28,11 +79,20 @@ def retry_request(request_func, url, **kwargs):
     """
     count = 0
     while count < MAX_RETRIES:
+        if stats is not None:
+            stats['attempts'] = count + 1
+        response = None
         try:
+            start = time.perf_counter()
             response = request_func(url, **kwargs)
             response.raise_for_status()  # Raises an HTTPError for bad responses
+            if stats is not None:
+                stats['latency'] = time.perf_counter() - start
             return response
         except requests.exceptions.RequestException as e:
+            if response is not None:
+                # A streamed response holds its connection until it is closed
+                response.close()
             logger.warning(f"Attempt {count + 1} failed: {str(e)}")
             count += 1
             if count < MAX_RETRIES:
@@ -42,12 +102,13 @@ def retry_request(request_func, url, **kwargs):
                 return None
 
 
-def request_api(url: str, **kwargs) -> dict:
+def request_api(url: str, stats: dict = None, **kwargs) -> dict:
     """
     Requests JSON data from the given API.
 
     Args:
         url (str): The URL to request.
+        stats (dict, optional): If given, request statistics are stored in it. See retry_request.
         kwargs (dict): Additional arguments for the request.
 
     Returns:
@@ -57,7 +118,7 @@ def request_api(url: str, **kwargs) -> dict:
         url = url_constructor(url, **kwargs)
 
     # Timeout to avoid hanging
-    response = retry_request(requests.get, url, timeout=10)
+    response = retry_request(get_session().get, url, stats=stats, timeout=10)
     if response:
         try:
             return response.json()  # Parse JSON response
@@ -67,6 +128,144 @@ def request_api(url: str, **kwargs) -> dict:
     return None
 
 
+def request_api_stream(url: str, key: str = 'members', stats: dict = None,
+                       **kwargs) -> Iterator[Any] | None:
+    """
+    Requests JSON data from the given API, yielding the items of one of its arrays
+    as the body arrives rather than loading the whole response.
+
+    Args:
+        url (str): The URL to request.
+        key (str, optional): The top-level key of the array to yield. Defaults to 'members'.
+        stats (dict, optional): If given, request statistics are stored in it. See retry_request.
+        kwargs (dict): Additional arguments for the request.
+
+    Returns:
+        Iterator: The items of the array, or None on failure.
+            Iterating raises json.JSONDecodeError if the body is malformed.
+            The response is closed once the iterator finishes, fails or is closed.
+    """
+    if kwargs:
+        url = url_constructor(url, **kwargs)
+
+    response = retry_request(get_session().get, url, stats=stats, timeout=10, stream=True)
+    if response:
+        return stream_json_array(response, key)
+    return None
+
+
+def stream_json_array(response: requests.Response, key: str) -> Iterator[Any]:
+    """
+    Yields the items of an array in a streamed response, closing the response when done
+    so its connection goes back to the pool.
+
+    Args:
+        response (requests.Response): The response, requested with stream=True.
+        key (str): The top-level key of the array.
+
+    Returns:
+        Iterator: The items of the array.
+    """
+    with response:
+        yield from iter_json_array(response.iter_content(chunk_size=STREAM_CHUNK_SIZE), key)
+
+
+def iter_json_array(chunks: Iterable[bytes], key: str) -> Iterator[Any]:
+    """
+    Incrementally parses a JSON object, yielding the items of the array at the given key.
+    Only one item and one chunk are held in memory at a time.
+    Other keys are parsed and discarded.
+
+    Args:
+        chunks (Iterable[bytes]): The UTF-8 encoded JSON object, in chunks.
+        key (str): The top-level key of the array.
+
+    Returns:
+        Iterator: The items of the array.
+
+    Throws:
+        json.JSONDecodeError: If the data is not a JSON object or is incomplete.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    pos = 0
+    finished = False
+
+    def more() -> bool:
+        nonlocal buffer, pos, finished
+        if finished:
+            return False
+        buffer = buffer[pos:]
+        pos = 0
+        chunk = next(chunks, None)
+        if chunk is None:
+            finished = True
+            buffer += text_decoder.decode(b'', final=True)
+        else:
+            buffer += text_decoder.decode(chunk)
+        return True
+
+    def token() -> str:
+        # Finds the next non-whitespace character without consuming it
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not more():
+                raise json.JSONDecodeError("Unexpected end of data", buffer, pos)
+
+    def value() -> Any:
+        # Decodes the next value, making sure it is not cut off by the end of the buffer
+        nonlocal pos
+        while True:
+            token()
+            try:
+                result, end = decoder.raw_decode(buffer, pos)
+                # A number cut off at the end of a chunk still decodes, as a shorter number,
+                # so it is only complete once it is followed by a delimiter
+                if finished or (end < len(buffer)
+                                and (buffer[pos] in '{["' or buffer[end] in ',]} \t\r\n')):
+                    pos = end
+                    return result
+            except json.JSONDecodeError:
+                if finished:
+                    raise
+            more()
+
+    def expect(char: str) -> None:
+        nonlocal pos
+        if token() != char:
+            raise json.JSONDecodeError(f"Expected '{char}'", buffer, pos)
+        pos += 1
+
+    expect('{')
+    if token() == '}':
+        return
+    while True:
+        name = value()
+        expect(':')
+        if name == key:
+            expect('[')
+            if token() == ']':
+                pos += 1
+            else:
+                while True:
+                    yield value()
+                    if token() == ']':
+                        pos += 1
+                        break
+                    expect(',')
+        else:
+            value()
+        if token() == '}':
+            return
+        expect(',')
+
+
 def request_img(url: str, **kwargs):
     """
     Requests an image from the given URL.
@@ -81,9 +280,9 @@ def request_img(url: str, **kwargs):
     if kwargs:
         url = url_constructor(url, **kwargs)
 
-    headers = kwargs.get('headers', {"User-Agent": "Mozilla/5.0"})
+    headers = kwargs.get('headers', {"User-Agent": HTTP_USER_AGENT})
 
-    response = retry_request(requests.get, url, headers=headers, timeout=10, stream=True)
+    response = retry_request(get_session().get, url, headers=headers, timeout=10)
     if response:
         return BytesIO(response.content)  # Return image as a file-like object
     return None
@@ -163,5 +362,14 @@ def to_suffixed_number(n: int) -> str:
 
 
 if __name__ == '__main__':
+    # Every way of splitting a page into chunks gives the same members
+    page = json.dumps({'page': 3, 'members': [{'id': '1', 'xp': 12.5}, {'id': '2', 'xp': -3e-2}, 7, 1.5e3],
+                       'tail': 1.5e3, 'z': 1, 'flags': [True, False, None]}).encode('utf-8')
+    expected = json.loads(page)['members']
+    for first in range(len(page) + 1):
+        for second in range(first, len(page) + 1):
+            chunks = [page[:first], page[first:second], page[second:]]
+            assert list(iter_json_array(chunks, 'members')) == expected, (first, second)
+
     dbr = DatabaseReader()
     print(dbr.get_profile_data(92029863090728960))